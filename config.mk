@@ -51,6 +51,9 @@ INPUT_FASTA?=examples/test.fasta
 # query table: table to restrict nt-level analysis to specified regions
 QUERY_TABLE?=none
 
+# local cache of input file hashes, to skip rehashing unchanged inputs (none to disable)
+UPLOAD_MANIFEST?=.upload_manifest.json
+
 # wait for job to complete
 WAIT?=true
 
@@ -61,9 +64,35 @@ WAIT?=true
 # Evo 2 model name
 MODEL_NAME?=evo2_7b
 
-# output type: logits, logits_and_embedding, embedding or summary_only
+# route sequences by length: none, or length to use the short context base model (e.g. evo2_7b_base)
+# for sequences up to 8192 and MODEL_NAME for longer ones (both checkpoints must be uploaded)
+MODEL_ROUTING?=none
+
+# run mode: score (evaluate sequences) or generate (sample continuations of the input sequences)
+RUN_MODE?=score
+
+# generate mode: tokens per sample, samples per prompt, sampling temperature and top-k, and batch size
+GENERATE_TOKENS?=500
+GENERATE_SAMPLES?=1
+GENERATE_TEMPERATURE?=1.0
+GENERATE_TOP_K?=4
+GENERATE_BATCH_SIZE?=8
+
+# generate mode: random seed for sampling, for reproducible samples (empty for unseeded)
+SEED?=
+
+# output type: logits, logits_and_embedding, embedding, summary_only or mutation_effects
 OUTPUT_TYPE?=logits
 
+# strands to evaluate: plus (sequences as given) or both (sequence and reverse complement)
+STRAND_MODE?=plus
+
+# precision of saved logits and embeddings: float32, bfloat16, float16 or int8
+OUTPUT_PRECISION?=float32
+
+# compression of saved logits and embeddings: none, zstd or lz4
+OUTPUT_COMPRESSION?=none
+
 # embedding layers to extract (only used if OUTPUT_TYPE includes embeddings)
 EMBEDDING_LAYERS?=blocks.28.mlp.l3
 
@@ -72,6 +101,12 @@ STEERING_LAYER?=
 STEERING_VECTOR_FILE?=
 STEERING_SCALES?=
 
+# save the output of blocks.N and reuse it in later runs of the same inputs, e.g. for steering sweeps (empty to disable)
+SNAPSHOT_BLOCK?=
+
+# seconds between progress reports (sequences, tokens/sec, ETA) in the job log
+PROGRESS_INTERVAL?=30
+
 # machine type
 MACHINE_TYPE?=a3-highgpu-1g
 
@@ -81,5 +116,10 @@ ACCELERATOR_TYPE?=nvidia-h100-80gb
 # accelerator count
 ACCELERATOR_COUNT?=1
 
+# machine used when MODEL_ROUTING=length and all sequences fit the short context model
+SHORT_MACHINE_TYPE?=$(MACHINE_TYPE)
+SHORT_ACCELERATOR_TYPE?=$(ACCELERATOR_TYPE)
+SHORT_ACCELERATOR_COUNT?=$(ACCELERATOR_COUNT)
+
 # jobs directory (description and output of the job)
 JOBS_DIR?=jobs
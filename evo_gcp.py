@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 
 import argparse
+import asyncio
 import os
 import re
 import subprocess
 import sys
-import signal
+
+# the job API is imported from EVO_GCP_DIR in main()
+evo_gcp_lib = None
 
 def parse_config_vars(config_path):
     """
@@ -47,14 +50,13 @@ def run_command(command):
     cmd_str = ' '.join(command)
     print(f"Running command: {cmd_str}")
     try:
-        exit_code = os.system(cmd_str)
-        # os.system returns a 16-bit encoded value: high byte is signal, low byte is exit code
-        if os.WIFSIGNALED(exit_code):
-            sig = os.WTERMSIG(exit_code)
-            print(f"Command terminated by signal {sig}", file=sys.stderr)
-            sys.exit(128 + sig)
-        elif os.WEXITSTATUS(exit_code) != 0:
-            print(f"Command exited with code {os.WEXITSTATUS(exit_code)}", file=sys.stderr)
+        exit_code = subprocess.run(command).returncode
+        # negative return codes are signals
+        if exit_code < 0:
+            print(f"Command terminated by signal {-exit_code}", file=sys.stderr)
+            sys.exit(128 - exit_code)
+        elif exit_code != 0:
+            print(f"Command exited with code {exit_code}", file=sys.stderr)
             sys.exit(1)
     except KeyboardInterrupt:
         print("\nInterrupted by user.", file=sys.stderr)
@@ -62,14 +64,168 @@ def run_command(command):
 
 def get_make_args(args, config_vars):
     """Constructs a list of KEY=VALUE strings for make."""
-    make_args = []
-    # We only need the keys from the config_vars to check against args
+    return [f"{key}={value}" for key, value in get_overrides(args, config_vars).items()]
+
+def get_overrides(args, config_vars):
+    """Returns a dict of config variables overridden on the command line."""
+    overrides = {}
     for key in config_vars.keys():
         arg_key = key.lower()
-        if hasattr(args, arg_key) and getattr(args, arg_key) is not None:
-            make_args.append(f"{key}={getattr(args, arg_key)}")
-    return make_args
-    
+        value = getattr(args, arg_key, None)
+        # flags (e.g. --wait) only override when set
+        if isinstance(value, bool):
+            value = 'true' if value else None
+        if value is not None:
+            overrides[key] = value
+    return overrides
+
+#####################################################################################
+# in-process commands (evo_gcp_lib)
+#####################################################################################
+
+def get_backends(config, backend='gcloud', local_bucket_dir=None, local_command=None):
+    """Returns the (storage, batch) backends of a config."""
+    if backend == 'local':
+        if not local_bucket_dir:
+            print("Error: --local_bucket_dir is required with --backend local", file=sys.stderr)
+            sys.exit(1)
+        return evo_gcp_lib.LocalStorage(local_bucket_dir), evo_gcp_lib.LocalBatch(local_bucket_dir, local_command)
+    return evo_gcp_lib.GcsStorage(config['BUCKET_NAME'], config['GCP_PROJECT']), evo_gcp_lib.GcloudBatch(config['LOCATION'])
+
+def split_list(value):
+    """Splits a comma-separated command-line value, None if not given."""
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+def run_lib_command(command, config, storage, batch, wait=False, args=None):
+    """Runs a command through the in-process job API."""
+    if command == 'create_bucket':
+        if storage.bucket_exists():
+            print(f"bucket {storage.url()} exists")
+        else:
+            storage.create_bucket(config['LOCATION'])
+            print(f"created bucket {storage.url()}")
+    elif command == 'upload_code':
+        evo_gcp_lib.upload_code(config, storage)
+    elif command == 'upload_fasta':
+        evo_gcp_lib.upload_inputs(config, storage)
+    elif command == 'build_json':
+        evo_gcp_lib.build_json(config, evo_gcp_lib.upload_inputs(config, storage))
+    elif command == 'submit':
+        state = evo_gcp_lib.submit(config, storage, batch, wait=wait)
+        if state is not None:
+            print(f"Job finished with status: {state}")
+            if state != 'SUCCEEDED':
+                sys.exit(1)
+    elif command == 'download':
+        try:
+            evo_gcp_lib.download(config, storage,
+                                 seq_ids=split_list(args.seq_ids), kinds=split_list(args.kinds),
+                                 layers=split_list(args.layers), scales=split_list(args.scales),
+                                 parallel=args.parallel)
+        except (IOError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+    elif command == 'show':
+        for remote_path in evo_gcp_lib.show(config, storage):
+            print(storage.url(remote_path))
+    elif command == 'list_jobs':
+        print(batch.list_jobs(), end='')
+    else:
+        raise ValueError(f"unknown command: {command}")
+
+#####################################################################################
+# concurrent job orchestration (submit_many)
+#####################################################################################
+
+def read_jobs_table(jobs_table, config_vars):
+    """
+    Reads a tab-delimited jobs table. The header holds config variable names (e.g. job, job_version,
+    input_fasta), each row is one job. Returns a list of dicts of config variable overrides.
+    """
+    jobs = []
+    with open(jobs_table, 'r') as f:
+        header = [column.strip().upper() for column in f.readline().rstrip('\n').split('\t')]
+        unknown = [column for column in header if column not in config_vars]
+        if unknown:
+            raise ValueError(f"jobs table has unknown columns: {', '.join(c.lower() for c in unknown)}")
+        if 'JOB' not in header:
+            raise ValueError("jobs table must have a 'job' column")
+        for line_num, line in enumerate(f, 2):
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
+            parts = line.split('\t')
+            if len(parts) != len(header):
+                raise ValueError(f"line {line_num}: expected {len(header)} columns, got {len(parts)}")
+            jobs.append({key: value.strip() for key, value in zip(header, parts) if value.strip() != ''})
+    return jobs
+
+async def run_job(config, storage, batch, semaphore, poll_interval):
+    """Submits a single job, polls it until done and downloads its results. Returns the final status."""
+    async with semaphore:
+        tag = config['JOB_TAG']
+        print(f"[{tag}] submitting")
+        try:
+            await asyncio.to_thread(evo_gcp_lib.submit, config, storage, batch, False)
+        except Exception as e:
+            print(f"[{tag}] submit failed: {e}", file=sys.stderr)
+            return tag, 'SUBMIT_FAILED'
+
+        status = None
+        while True:
+            new_status = await asyncio.to_thread(batch.state, tag)
+            if new_status != status:
+                print(f"[{tag}] status: {new_status}")
+                status = new_status
+            if status in evo_gcp_lib.DONE_STATES:
+                break
+            await asyncio.sleep(poll_interval)
+
+        if status != 'SUCCEEDED':
+            detail = batch.failure_detail(tag) if status == 'FAILED' else None
+            return tag, f"{status}, {detail}" if detail else status
+
+        print(f"[{tag}] downloading")
+        try:
+            await asyncio.to_thread(evo_gcp_lib.download, config, storage)
+        except Exception as e:
+            print(f"[{tag}] download failed: {e}", file=sys.stderr)
+            return tag, 'DOWNLOAD_FAILED'
+        print(f"[{tag}] done")
+        return tag, status
+
+async def run_jobs(configs, storage, batch, max_concurrent, poll_interval):
+    """Runs jobs concurrently, with at most max_concurrent jobs in flight."""
+    semaphore = asyncio.Semaphore(max_concurrent)
+    tasks = [run_job(config, storage, batch, semaphore, poll_interval) for config in configs]
+    return await asyncio.gather(*tasks)
+
+def submit_many(args, config, config_vars):
+    """Entry point of the submit_many command."""
+    try:
+        table_jobs = read_jobs_table(args.jobs_table, config_vars)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # command line overrides apply to all jobs, table columns override them per job
+    configs = [config.with_overrides(row) for row in table_jobs]
+    storage, batch = get_backends(config, args.backend, args.local_bucket_dir, args.local_command)
+
+    print(f"running {len(configs)} jobs, up to {args.max_concurrent} at a time")
+    try:
+        results = asyncio.run(run_jobs(configs, storage, batch, args.max_concurrent, args.poll_interval))
+    except KeyboardInterrupt:
+        print("\nInterrupted by user.", file=sys.stderr)
+        sys.exit(130)
+
+    failed = [(tag, status) for tag, status in results if status != 'SUCCEEDED']
+    print(f"\n{len(results) - len(failed)} of {len(results)} jobs succeeded")
+    for tag, status in failed:
+        print(f"  {tag}: {status}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
 def main():
     """Main function."""
     evo_gcp_dir = os.environ.get('EVO_GCP_DIR')
@@ -89,6 +245,10 @@ def main():
     # Hard-code the use of the main config file for variable definitions and descriptions.
     config_vars = parse_config_vars('config.mk')
 
+    global evo_gcp_lib
+    sys.path.insert(0, os.getcwd())
+    import evo_gcp_lib
+
     examples = """
 Usage example:
   # Build the docker image
@@ -102,6 +262,9 @@ Usage example:
 
   # Download the results for a specific job
   evo_gcp download --job my-first-run
+
+  # Run all jobs listed in a table, 8 at a time, downloading results as jobs complete
+  evo_gcp submit_many --jobs_table jobs.tsv --max_concurrent 8
 """
 
     parser = argparse.ArgumentParser(
@@ -118,11 +281,12 @@ Usage example:
         'create_bucket': 'Creates the GCS bucket specified by BUCKET_NAME in the configured LOCATION.',
         'setup_bucket': 'A combo command that creates the bucket, uploads the model, and uploads the code.\nThis runs the `create_bucket`, `upload_model`, and `upload_code` commands in sequence.',
         'upload_model': 'Uploads the specified ML model to the GCS bucket.',
-        'upload_code': 'Uploads the `scripts` and `configs` directories to the GCS bucket.',
-        'upload_fasta': 'Uploads a specific FASTA file to the job directory in the GCS bucket.\nRequires --input_fasta.',
-        'build_json': 'Builds the job.json configuration file for a batch job.',
+        'upload_code': 'Uploads the `scripts` and `configs` directories to the GCS bucket.\nOnly files that differ from the bucket copy are uploaded.',
+        'upload_fasta': 'Uploads a specific FASTA file to the GCS bucket, under a content-addressed path\n(inputs/<sha256>/input.fasta) shared by all jobs with the same input.\nAlso uploads the query table and steering vector file if set.\nRequires --input_fasta.',
+        'build_json': 'Builds the job.json configuration file for a batch job.\nUploads the job inputs first, since the job refers to their content-addressed paths.',
         'submit': 'Submits a job to Google Cloud Batch.\nThis combines `upload_code`, `upload_fasta`, and `build_json` before submitting.\nUse --wait to block until the job completes.',
-        'download': 'Downloads the output of a completed job from the GCS bucket into the local `jobs` directory.',
+        'submit_many': 'Submits all jobs listed in a tab-delimited jobs table and runs them concurrently.\nThe table header holds config variable names (e.g. job, job_version, input_fasta), one job per row.\nAt most --max_concurrent jobs are in flight. Results are downloaded as each job completes.\nCommand-line config arguments apply to all jobs, table columns override them.',
+        'download': 'Downloads the output of a completed job from the GCS bucket into the local `jobs` directory.\nUses the output index written by the job to select files by sequence, kind, layer and scale.\nFiles are fetched in parallel and verified by MD5; files that match locally are skipped,\nand interrupted downloads are resumed.',
         'list_jobs': 'Lists all Google Cloud Batch jobs in the configured GCP location.',
         'show': 'Shows the contents of the remote job directory in the GCS bucket.'
     }
@@ -130,12 +294,15 @@ Usage example:
     # Dynamically add commands and their arguments
     commands = [
         'docker_image', 'create_bucket', 'upload_model', 'upload_code', 
-        'upload_fasta', 'build_json', 'submit', 'download', 'list_jobs', 'show'
+        'upload_fasta', 'build_json', 'submit', 'submit_many', 'download', 'list_jobs', 'show'
     ]
     
     combo_commands = {
         'setup_bucket': ['create_bucket', 'upload_model', 'upload_code']
     }
+
+    # commands still run as make targets, all others run in-process
+    make_commands = ['docker_image', 'upload_model']
     
     all_commands = commands + list(combo_commands.keys())
     
@@ -154,6 +321,27 @@ Usage example:
             cmd_parser.add_argument('--wait', action='store_true', help='Wait for the job to complete.')
             added_args.add('--wait')
 
+        if cmd == 'submit_many':
+            cmd_parser.add_argument('--jobs_table', required=True, help='Tab-delimited table of jobs, one job per row.')
+            cmd_parser.add_argument('--max_concurrent', type=int, default=4, help='Maximal number of jobs in flight. Default: 4')
+            cmd_parser.add_argument('--poll_interval', type=float, default=30, help='Seconds between job status checks. Default: 30')
+            cmd_parser.add_argument('--local_command', help='Command run for each job by the local backend, with JOB and MNT_DIR set\nas in the container (e.g. "bash scripts/run_evo.sh"). Without it jobs succeed immediately.')
+            added_args.update(['--jobs_table', '--max_concurrent', '--poll_interval', '--local_command'])
+
+        if cmd == 'download':
+            cmd_parser.add_argument('--seq_ids', help='Comma-separated sequence IDs to download (default: all).')
+            cmd_parser.add_argument('--kinds', help='Comma-separated output kinds to download: summary, strands, logits, embeddings,\nmutation_effects, mutation_effects_table, generated, processed_ids (default: all).')
+            cmd_parser.add_argument('--layers', help='Comma-separated embedding layers to download (default: all).')
+            cmd_parser.add_argument('--scales', help='Comma-separated scales to download, e.g. unsteered,scale_1.0 (default: all).')
+            cmd_parser.add_argument('--parallel', type=int, default=8, help='Number of files fetched in parallel. Default: 8')
+            added_args.update(['--seq_ids', '--kinds', '--layers', '--scales', '--parallel'])
+
+        if cmd in ('submit_many', 'download'):
+            cmd_parser.add_argument('--backend', choices=['gcloud', 'local'], default='gcloud',
+                                    help='gcloud (Google Cloud Batch) or local (a local directory stands in for the bucket,\nfor offline testing). Default: gcloud')
+            cmd_parser.add_argument('--local_bucket_dir', help='Directory standing in for the bucket (local backend).')
+            added_args.update(['--backend', '--local_bucket_dir'])
+
         for var, data in config_vars.items():
             arg_name = f'--{var.lower()}'
             if arg_name not in added_args:
@@ -169,23 +357,13 @@ Usage example:
         print("\nConfiguration Arguments (from config.mk):", file=sys.stderr)
         
         if config_vars:
-            # Evaluate default values by calling make for each variable
-            evaluated_defaults = {}
-            for var in config_vars.keys():
-                try:
-                    # Use the generic 'print-VAR' rule now in the makefile
-                    command = ['make', '-s', f'print-{var}']
-                    result = subprocess.run(
-                        command,
-                        capture_output=True,
-                        text=True,
-                        check=True,
-                        cwd=evo_gcp_dir 
-                    )
-                    evaluated_defaults[var] = result.stdout.strip()
-                except (subprocess.CalledProcessError, FileNotFoundError):
-                    # If make fails, fall back to the raw value from the config file
-                    evaluated_defaults[var] = config_vars[var].get('value', 'N/A')
+            # Evaluate default values once, in-process
+            try:
+                config = evo_gcp_lib.load_config('makefile')
+                evaluated_defaults = {var: config[var] for var in config_vars.keys()}
+            except (OSError, ValueError):
+                # fall back to the raw values from the config file
+                evaluated_defaults = {var: data.get('value', 'N/A') for var, data in config_vars.items()}
 
             # Calculate padding for alignment
             max_len = max(len(f'--{var.lower()}') for var in config_vars.keys())
@@ -200,15 +378,22 @@ Usage example:
 
     args = parser.parse_args()
     make_args = get_make_args(args, config_vars)
-    
-    if args.command in combo_commands:
-        for target in combo_commands[args.command]:
+
+    # config is evaluated once for all in-process commands
+    config = evo_gcp_lib.load_config('makefile', overrides=get_overrides(args, config_vars))
+
+    if args.command == 'submit_many':
+        submit_many(args, config, config_vars)
+        return
+
+    storage, batch = get_backends(config, getattr(args, 'backend', 'gcloud'), getattr(args, 'local_bucket_dir', None))
+    wait = args.command == 'submit' and (args.wait or bool(config['WAIT']))
+    targets = combo_commands.get(args.command, [args.command])
+    for target in targets:
+        if target in make_commands:
             run_command(['make', target] + make_args)
-    else:
-        command_to_run = ['make', args.command] + make_args
-        if args.command == 'submit' and args.wait:
-            command_to_run.append('WAIT=true')
-        run_command(command_to_run)
+        else:
+            run_lib_command(target, config, storage, batch, wait, args)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,23 @@
+"""In-process job API of evo2_gcp, shared by evo_gcp.py and the makefile."""
+
+from .config import Config, load_config, parse_makefile
+from .storage import GcsStorage, LocalStorage, sync_dir, download_prefix
+from .batch import DONE_STATES, GcloudBatch, LocalBatch
+from .upload import UploadManifest, get_manifest, upload_content_addressed
+from .job_json import build_job_config, write_job_config
+from .routing import route_job
+from .download import read_output_index, select_outputs, download_outputs
+from .jobs import (upload_code, upload_inputs, build_json, submit_job, wait_for_job,
+                   submit, download, show)
+
+__all__ = [
+    'Config', 'load_config', 'parse_makefile',
+    'GcsStorage', 'LocalStorage', 'sync_dir', 'download_prefix',
+    'DONE_STATES', 'GcloudBatch', 'LocalBatch',
+    'UploadManifest', 'get_manifest', 'upload_content_addressed',
+    'build_job_config', 'write_job_config',
+    'route_job',
+    'read_output_index', 'select_outputs', 'download_outputs',
+    'upload_code', 'upload_inputs', 'build_json', 'submit_job', 'wait_for_job',
+    'submit', 'download', 'show',
+]
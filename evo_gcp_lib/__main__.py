@@ -0,0 +1,64 @@
+import argparse
+import sys
+
+from .batch import GcloudBatch
+from .config import load_config
+from .storage import GcsStorage
+from .jobs import upload_code, upload_inputs, build_json, submit_job
+
+def parse_overrides(parser, assignments):
+    """Returns a dict of VAR=value command-line variable assignments (as passed by make in MAKEOVERRIDES)."""
+    overrides = {}
+    for assignment in assignments:
+        key, sep, value = assignment.partition('=')
+        if not sep or not key:
+            parser.error(f"invalid variable assignment: {assignment}")
+        overrides[key] = value
+    return overrides
+
+def main():
+    parser = argparse.ArgumentParser(description="evo2_gcp job API commands used by the makefile.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    submit_parser = subparsers.add_parser('submit_job', help="Submits a job configuration to Google Cloud Batch.")
+    submit_parser.add_argument('--job-name', required=True, help="Batch job name.")
+    submit_parser.add_argument('--location', required=True, help="GCP location of the job.")
+    submit_parser.add_argument('--job-json', required=True, help="Job configuration file.")
+    submit_parser.add_argument('--wait', action='store_true', help="Wait for the job to complete.")
+    submit_parser.add_argument('--poll-interval', type=float, default=30, help="Seconds between status checks.")
+
+    # commands evaluating the makefile configuration, as evo_gcp.py does
+    config_commands = {
+        'upload_code': "Uploads the scripts and configs directories, only files that differ from the bucket copy.",
+        'upload_inputs': "Uploads the input FASTA, query table and steering vector to content-addressed paths.",
+        'build_json': "Uploads the job inputs and writes the job configuration file (JOB_JSON)."
+    }
+    for command, help_text in config_commands.items():
+        config_parser = subparsers.add_parser(command, help=help_text)
+        config_parser.add_argument('--makefile', default='makefile', help="Makefile holding the configuration.")
+        config_parser.add_argument('overrides', nargs='*', metavar='VAR=value', help="Command-line variable overrides.")
+
+    args = parser.parse_args()
+
+    if args.command == 'submit_job':
+        state = submit_job(GcloudBatch(args.location), args.job_name, args.job_json, args.wait, args.poll_interval)
+        if state is not None:
+            print(f"Job finished with status: {state}")
+            if state == 'FAILED':
+                sys.exit(1)
+        return
+
+    config = load_config(args.makefile, overrides=parse_overrides(parser, args.overrides))
+    storage = GcsStorage(config['BUCKET_NAME'], config['GCP_PROJECT'])
+    try:
+        if args.command == 'upload_code':
+            upload_code(config, storage)
+        elif args.command == 'upload_inputs':
+            upload_inputs(config, storage)
+        elif args.command == 'build_json':
+            build_json(config, upload_inputs(config, storage))
+    except ValueError as e:
+        parser.error(str(e))
+
+if __name__ == "__main__":
+    main()
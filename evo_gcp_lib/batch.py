@@ -0,0 +1,90 @@
+import os
+import shlex
+import subprocess
+
+from .job_json import read_job_env
+
+# terminal states of a Google Cloud Batch job
+DONE_STATES = ['SUCCEEDED', 'FAILED', 'DELETION_IN_PROGRESS']
+
+class GcloudBatch:
+    """Google Cloud Batch, accessed through single gcloud calls."""
+
+    def __init__(self, location):
+        self.location = location
+
+    def run(self, args, check=True):
+        command = ['gcloud', 'batch', 'jobs'] + args + [f"--location={self.location}"]
+        return subprocess.run(command, capture_output=True, text=True, check=check)
+
+    def state(self, name):
+        """Returns the state of a job, or None if the job does not exist."""
+        result = self.run(['describe', name, '--format=value(status.state)'], check=False)
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip()
+
+    def delete(self, name):
+        self.run(['delete', name, '--quiet'])
+
+    def submit(self, name, job_json):
+        self.run(['submit', name, f"--config={job_json}"])
+
+    def list_jobs(self):
+        return self.run(['list']).stdout
+
+    def failure_detail(self, name):
+        """Where to find the diagnostics of a failed job, None if there is nothing beyond Cloud Logging."""
+        return None
+
+class LocalBatch:
+    """
+    Local stand-in for Google Cloud Batch, for offline runs and testing.
+    A submitted job optionally runs a local command, with the environment variables of the
+    job configuration and MNT_DIR pointing at the local bucket directory. The job state follows
+    the command's exit code. Without a command, jobs succeed immediately.
+    The command's output is written to local_job.log in the job directory of the local bucket.
+    """
+
+    def __init__(self, mnt_dir, command=None):
+        self.mnt_dir = os.path.abspath(mnt_dir)
+        self.command = command
+        self.jobs = {}
+        self.log_paths = {}
+
+    def state(self, name):
+        if name not in self.jobs:
+            return None
+        process = self.jobs[name]
+        if process is None:
+            return 'SUCCEEDED'
+        code = process.poll()
+        if code is None:
+            return 'RUNNING'
+        return 'SUCCEEDED' if code == 0 else 'FAILED'
+
+    def delete(self, name):
+        process = self.jobs.pop(name, None)
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def submit(self, name, job_json):
+        if not self.command:
+            self.jobs[name] = None
+            return
+        env = dict(os.environ, **read_job_env(job_json))
+        env['MNT_DIR'] = self.mnt_dir
+        log_path = os.path.join(self.mnt_dir, 'jobs', name, 'local_job.log')
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        with open(log_path, 'w') as log_file:
+            self.jobs[name] = subprocess.Popen(shlex.split(self.command), env=env, cwd=self.mnt_dir,
+                                               stdout=log_file, stderr=subprocess.STDOUT)
+        self.log_paths[name] = log_path
+
+    def list_jobs(self):
+        return ''.join(f"{name}\t{self.state(name)}\n" for name in self.jobs)
+
+    def failure_detail(self, name):
+        if name not in self.log_paths:
+            return None
+        return f"see {self.log_paths[name]}"
@@ -0,0 +1,90 @@
+import os
+import re
+
+# variable assignment outside of recipes: NAME = value, NAME ?= value, NAME := value
+ASSIGNMENT_RE = re.compile(r'^([A-Za-z_][A-Za-z0-9_]*)\s*(\?=|:=|=)\s*(.*)$')
+
+# variable reference: $(NAME) or ${NAME}
+REFERENCE_RE = re.compile(r'\$(?:\(([A-Za-z_][A-Za-z0-9_]*)\)|\{([A-Za-z_][A-Za-z0-9_]*)\})')
+
+def parse_makefile(path, definitions=None, environ=None):
+    """
+    Reads variable assignments from a makefile, following include lines.
+    Follows make precedence: '=' and ':=' always assign, '?=' only assigns variables that are
+    not defined yet, either in an earlier file or in the environment. Values are kept unexpanded.
+    """
+    definitions = {} if definitions is None else definitions
+    environ = os.environ if environ is None else environ
+    base_dir = os.path.dirname(path)
+    with open(path, 'r') as f:
+        for line in f:
+            # recipe lines are not evaluated
+            if line.startswith('\t'):
+                continue
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith('include '):
+                for include_file in line.split()[1:]:
+                    parse_makefile(os.path.join(base_dir, include_file), definitions, environ)
+                continue
+            match = ASSIGNMENT_RE.match(line)
+            if not match:
+                continue
+            key, operator, value = match.groups()
+            if operator == '?=' and (key in definitions or key in environ):
+                continue
+            definitions[key] = value.strip()
+    return definitions
+
+class Config:
+    """
+    Evaluated makefile configuration. Variables are expanded on access, with command-line
+    overrides taking precedence over the makefile, and the environment as fallback.
+    """
+
+    def __init__(self, definitions, overrides=None, environ=None):
+        self.definitions = dict(definitions)
+        self.overrides = {k: str(v) for k, v in (overrides or {}).items()}
+        self.environ = dict(os.environ if environ is None else environ)
+        self.cache = {}
+
+    def with_overrides(self, overrides):
+        """Returns a new config with additional command-line overrides."""
+        return Config(self.definitions, dict(self.overrides, **overrides), self.environ)
+
+    def raw(self, name):
+        if name in self.overrides:
+            return self.overrides[name]
+        if name in self.definitions:
+            return self.definitions[name]
+        return self.environ.get(name, '')
+
+    def expand(self, value, stack=()):
+        """Expands variable references in a value."""
+        def replace(match):
+            name = match.group(1) or match.group(2)
+            if name in stack:
+                raise ValueError(f"recursive variable reference: {' -> '.join(stack + (name,))}")
+            return self.resolve(name, stack + (name,))
+        return REFERENCE_RE.sub(replace, value).replace('$$', '$')
+
+    def resolve(self, name, stack=()):
+        if name not in self.cache:
+            self.cache[name] = self.expand(self.raw(name), stack or (name,))
+        return self.cache[name]
+
+    def __getitem__(self, name):
+        return self.resolve(name)
+
+    def get(self, name, default=''):
+        value = self.resolve(name)
+        return value if value != '' else default
+
+    def names(self):
+        return list(self.definitions.keys())
+
+def load_config(makefile='makefile', overrides=None, environ=None):
+    """Evaluates the makefile variables once and returns a Config."""
+    definitions = parse_makefile(makefile, environ=environ)
+    return Config(definitions, overrides, environ)
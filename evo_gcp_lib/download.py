@@ -0,0 +1,125 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .storage import file_md5, download_prefix
+
+# index written by the job into its output directory (see scripts/output_index.py)
+INDEX_FILE = 'output_index.tsv'
+
+# bytes fetched per ranged read, a partial file is resumed from the last complete chunk
+CHUNK_SIZE = 64 << 20
+
+def read_output_index(storage, remote_dir):
+    """Returns the rows of a job's output index as dicts, or None if the job wrote no index."""
+    remote_path = f"{remote_dir}/{INDEX_FILE}"
+    if storage.md5(remote_path) is None:
+        return None
+    lines = storage.read_bytes(remote_path).decode('utf-8').splitlines()
+    header = lines[0].split('\t')
+    rows = []
+    for line in lines[1:]:
+        if line:
+            row = dict(zip(header, line.split('\t')))
+            row['size'] = int(row['size'])
+            rows.append(row)
+    return rows
+
+def select_outputs(rows, seq_ids=None, kinds=None, layers=None, scales=None):
+    """
+    Filters index rows. Each filter is a list of allowed values (None or empty for any).
+    Files that are not specific to a sequence or layer (e.g. summary tables) pass the seq_id and layer filters.
+    """
+    selected = []
+    for row in rows:
+        if kinds and row['kind'] not in kinds:
+            continue
+        if scales and row['scale'] and row['scale'] not in scales:
+            continue
+        if seq_ids and row['seq_id'] and row['seq_id'] not in seq_ids:
+            continue
+        if layers and row['layer'] and row['layer'] not in layers:
+            continue
+        selected.append(row)
+    return selected
+
+def fetch_file(storage, remote_path, local_path, size, md5):
+    """
+    Downloads a file in ranged chunks into <local_path>.part, resuming a previous partial download,
+    verifies its MD5 and moves it into place. Returns 'skipped' if the local file already matches.
+    """
+    if os.path.isfile(local_path) and os.path.getsize(local_path) == size and file_md5(local_path) == md5:
+        return 'skipped'
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    part_path = local_path + '.part'
+
+    for attempt in range(2):
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        if offset > size:
+            offset = 0
+        elif offset:
+            print(f"  resuming {remote_path} from byte {offset}")
+        with open(part_path, 'ab' if offset else 'wb') as f:
+            while offset < size:
+                data = storage.read_range(remote_path, offset, min(offset + CHUNK_SIZE, size))
+                if not data:
+                    raise IOError(f"unexpected end of {remote_path} at byte {offset} of {size}")
+                f.write(data)
+                offset += len(data)
+        if file_md5(part_path) == md5:
+            os.replace(part_path, local_path)
+            return 'downloaded'
+        # a corrupt partial file, start over once
+        os.remove(part_path)
+    raise IOError(f"checksum mismatch for {remote_path}")
+
+def download_outputs(storage, remote_dir, local_dir, seq_ids=None, kinds=None, layers=None, scales=None, parallel=8):
+    """
+    Downloads the selected outputs of a job in parallel, using the output index written by the job.
+    Returns a dict counting downloaded, skipped and failed files.
+    Jobs without an index (written before the index was added) are downloaded in full.
+    """
+    rows = read_output_index(storage, remote_dir)
+    if rows is None:
+        if seq_ids or kinds or layers or scales:
+            raise ValueError(f"no output index in {storage.url(remote_dir)}, filters are not available")
+        print(f"no output index in {storage.url(remote_dir)}, downloading all files")
+        return {'downloaded': download_prefix(storage, remote_dir, local_dir), 'skipped': 0, 'failed': 0}
+
+    selected = select_outputs(rows, seq_ids, kinds, layers, scales)
+    total_size = sum(row['size'] for row in selected)
+    print(f"downloading {len(selected)} of {len(rows)} files ({total_size / 1024 ** 2:.1f} MB) with {parallel} workers")
+
+    # the index and log are small and always fetched
+    files = [(row['file'], row['size'], row['md5']) for row in selected]
+    for name in [INDEX_FILE, 'run_evo.log']:
+        remote_md5 = storage.md5(f"{remote_dir}/{name}")
+        if remote_md5 is not None:
+            files.append((name, None, remote_md5))
+
+    counts = {'downloaded': 0, 'skipped': 0, 'failed': 0}
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as executor:
+        futures = {}
+        for name, size, md5 in files:
+            local_path = os.path.join(local_dir, name)
+            remote_path = f"{remote_dir}/{name}"
+            if size is None:
+                futures[executor.submit(fetch_whole_file, storage, remote_path, local_path, md5)] = name
+            else:
+                futures[executor.submit(fetch_file, storage, remote_path, local_path, size, md5)] = name
+        for future in as_completed(futures):
+            try:
+                status = future.result()
+            except Exception as e:
+                print(f"  failed {futures[future]}: {e}")
+                counts['failed'] += 1
+                continue
+            counts['skipped' if status == 'skipped' else 'downloaded'] += 1
+    return counts
+
+def fetch_whole_file(storage, remote_path, local_path, md5):
+    """Downloads a file of unknown size unless the local copy matches."""
+    if os.path.isfile(local_path) and file_md5(local_path) == md5:
+        return 'skipped'
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    storage.download_file(remote_path, local_path)
+    return 'downloaded'
@@ -0,0 +1,119 @@
+import json
+
+OUTPUT_TYPES = ['logits', 'logits_and_embedding', 'embedding', 'summary_only', 'mutation_effects']
+STRAND_MODES = ['plus', 'both']
+RUN_MODES = ['score', 'generate']
+OUTPUT_PRECISIONS = ['float32', 'bfloat16', 'float16', 'int8']
+OUTPUT_COMPRESSIONS = ['none', 'zstd', 'lz4']
+
+# mount point of the bucket inside the container
+MNT_DIR = "/mnt/disks/share"
+
+def validate_job_env(env):
+    """Checks the container environment of a job, raises ValueError on invalid values."""
+    checks = [
+        ('OUTPUT_TYPE', OUTPUT_TYPES),
+        ('STRAND_MODE', STRAND_MODES),
+        ('RUN_MODE', RUN_MODES),
+        ('OUTPUT_PRECISION', OUTPUT_PRECISIONS),
+        ('OUTPUT_COMPRESSION', OUTPUT_COMPRESSIONS)
+    ]
+    for key, allowed in checks:
+        if key in env and env[key] not in allowed:
+            raise ValueError(f"Invalid {key}: {env[key]}. Allowed values are: {', '.join(allowed)}.")
+    if env.get('OUTPUT_TYPE') in ['logits_and_embedding', 'embedding'] and not env.get('EMBEDDING_LAYERS'):
+        raise ValueError("EMBEDDING_LAYERS is required when OUTPUT_TYPE includes embeddings.")
+
+def build_job_config(remote_path, image_uri, run_script_path, env,
+                     machine_type="a3-highgpu-1g", disk_size_gb=100,
+                     accelerator_type="nvidia-h100-80gb", accelerator_count=1,
+                     provisioning_model="SPOT", max_retry_count=0):
+    """
+    Returns the Google Cloud Batch job configuration (as a dict) for running a script in the container.
+    env holds the job environment variables (JOB, MODEL_NAME, OUTPUT_TYPE, ...).
+    """
+    validate_job_env(env)
+
+    # drop embedding layers unless embeddings are requested
+    env = dict(env)
+    if env.get('OUTPUT_TYPE') not in ['logits_and_embedding', 'embedding']:
+        env['EMBEDDING_LAYERS'] = ""
+
+    # The script path is relative to the mount point
+    container_command = f"bash {MNT_DIR}/{run_script_path}"
+
+    cuda_visible_devices = ",".join(map(str, range(int(accelerator_count))))
+
+    return {
+        "taskGroups": [
+            {
+                "name": "gpu-task-group",
+                "taskSpec": {
+                    "runnables": [
+                        {
+                            "container": {
+                                "imageUri": image_uri,
+                                "entrypoint": "/bin/bash",
+                                "commands": [
+                                    "-c",
+                                    container_command
+                                ],
+                                "options": f"--workdir {MNT_DIR}"
+                            }
+                        }
+                    ],
+                    "environment": {
+                        "variables": dict(
+                            {"MNT_DIR": MNT_DIR},
+                            **env,
+                            CUDA_VISIBLE_DEVICES=cuda_visible_devices
+                        )
+                    },
+                    "volumes": [
+                        {
+                            "gcs": {
+                                "remotePath": remote_path
+                            },
+                            "mountPath": MNT_DIR
+                        }
+                    ],
+                    "maxRetryCount": int(max_retry_count)
+                },
+                "taskCount": 1
+            }
+        ],
+        "allocationPolicy": {
+            "instances": [
+                {
+                    "installGpuDrivers": True,
+                    "policy": {
+                        "machineType": machine_type,
+                        "bootDisk": {
+                            "type": "pd-ssd",
+                            "sizeGb": int(disk_size_gb)
+                        },
+                        "accelerators": [
+                            {
+                                "type": accelerator_type,
+                                "count": int(accelerator_count)
+                            }
+                        ],
+                        "provisioningModel": provisioning_model
+                    }
+                }
+            ]
+        },
+        "logsPolicy": {
+            "destination": "CLOUD_LOGGING"
+        }
+    }
+
+def write_job_config(path, job_config):
+    with open(path, 'w') as f:
+        json.dump(job_config, f, indent=4)
+
+def read_job_env(path):
+    """Returns the environment variables of a job configuration file."""
+    with open(path, 'r') as f:
+        job_config = json.load(f)
+    return job_config["taskGroups"][0]["taskSpec"]["environment"]["variables"]
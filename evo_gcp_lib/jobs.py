@@ -0,0 +1,135 @@
+import os
+import time
+
+from .batch import DONE_STATES
+from .job_json import build_job_config, write_job_config
+from .routing import route_job
+from .download import download_outputs
+from .upload import get_manifest, upload_dir_cached, upload_content_addressed
+
+def job_remote_dir(config):
+    return f"jobs/{config['JOB_TAG']}"
+
+def upload_code(config, storage):
+    """Uploads the scripts and configs directories to the bucket, skipping directories that did not change."""
+    manifest = get_manifest(config, storage)
+    for local_dir, remote_dir in [(config['SCRIPTS_DIR'], 'scripts'), (config['CONFIGS_DIR'], 'configs')]:
+        upload_dir_cached(storage, manifest, local_dir, remote_dir)
+
+def upload_inputs(config, storage):
+    """
+    Uploads the input FASTA, and the query table and steering vector if set, to content-addressed
+    paths in the bucket. Returns the container environment variables pointing at the uploaded files.
+    """
+    manifest = get_manifest(config, storage)
+    inputs = [('INPUT_FASTA_PATH', config['INPUT_FASTA'], 'input.fasta')]
+    if config.get('QUERY_TABLE', 'none') != 'none':
+        inputs.append(('QUERY_TABLE_PATH', config['QUERY_TABLE'], 'query_table.csv'))
+    if config.get('STEERING_VECTOR_FILE'):
+        inputs.append(('STEERING_VECTOR_PATH', config['STEERING_VECTOR_FILE'], 'steering_vector.tsv'))
+    input_env = {'INPUT_FASTA_PATH': '', 'QUERY_TABLE_PATH': '', 'STEERING_VECTOR_PATH': ''}
+    for key, local_path, name in inputs:
+        input_env[key] = upload_content_addressed(storage, manifest, local_path, name)
+    return input_env
+
+def job_env(config, input_env=None):
+    """Returns the container environment variables of a job."""
+    return dict({
+        "JOB": config['JOB_TAG'],
+        "MODEL_NAME": config['MODEL_NAME'],
+        "OUTPUT_TYPE": config['OUTPUT_TYPE'],
+        "STRAND_MODE": config.get('STRAND_MODE', 'plus'),
+        "OUTPUT_PRECISION": config.get('OUTPUT_PRECISION', 'float32'),
+        "OUTPUT_COMPRESSION": config.get('OUTPUT_COMPRESSION', 'none'),
+        "RUN_MODE": config.get('RUN_MODE', 'score'),
+        "GENERATE_TOKENS": config.get('GENERATE_TOKENS', '500'),
+        "GENERATE_SAMPLES": config.get('GENERATE_SAMPLES', '1'),
+        "GENERATE_TEMPERATURE": config.get('GENERATE_TEMPERATURE', '1.0'),
+        "GENERATE_TOP_K": config.get('GENERATE_TOP_K', '4'),
+        "GENERATE_BATCH_SIZE": config.get('GENERATE_BATCH_SIZE', '8'),
+        "SEED": config.get('SEED', ''),
+        "EMBEDDING_LAYERS": config['EMBEDDING_LAYERS'],
+        "STEERING_LAYER": config['STEERING_LAYER'],
+        "STEERING_SCALES": config['STEERING_SCALES'],
+        "MODEL_ROUTES": config.get('MODEL_ROUTES', ''),
+        "SNAPSHOT_BLOCK": config.get('SNAPSHOT_BLOCK', ''),
+        "PROGRESS_INTERVAL": config.get('PROGRESS_INTERVAL', '30')
+    }, **(input_env or {}))
+
+def build_json(config, input_env=None):
+    """
+    Writes the job configuration file (JOB_JSON) and returns its path.
+    input_env holds the remote input paths returned by upload_inputs.
+    With MODEL_ROUTING=length, the model and machine are chosen by the input sequence lengths.
+    """
+    config = config.with_overrides(route_job(config))
+    job_config = build_job_config(
+        remote_path=config['BUCKET_NAME'],
+        image_uri=config['DOCKER_IMAGE'],
+        run_script_path=config['SCRIPT_PATH'],
+        env=job_env(config, input_env),
+        machine_type=config['MACHINE_TYPE'],
+        accelerator_type=config['ACCELERATOR_TYPE'],
+        accelerator_count=config['ACCELERATOR_COUNT']
+    )
+    os.makedirs(config['JOB_DIR'], exist_ok=True)
+    write_job_config(config['JOB_JSON'], job_config)
+    print(f"generated job configuration file at: {config['JOB_JSON']}")
+    return config['JOB_JSON']
+
+def wait_for_job(batch, name, poll_interval=30):
+    """Polls a job until it reaches a terminal state, returns the state."""
+    state = None
+    while True:
+        new_state = batch.state(name)
+        if new_state != state:
+            print(f"job {name} status: {new_state}")
+            state = new_state
+        if state in DONE_STATES:
+            detail = batch.failure_detail(name) if state == 'FAILED' else None
+            if detail:
+                print(f"job {name} failed, {detail}")
+            return state
+        time.sleep(poll_interval)
+
+def submit_job(batch, name, job_json, wait=False, poll_interval=30):
+    """
+    Submits a job, replacing an existing job with the same name.
+    Returns the final state if wait is set, otherwise None.
+    """
+    if batch.state(name) is not None:
+        print(f"job {name} exists, deleting it")
+        batch.delete(name)
+        while batch.state(name) is not None:
+            time.sleep(5)
+        print(f"job {name} deleted")
+
+    print(f"submitting job {name}")
+    batch.submit(name, job_json)
+    if wait:
+        return wait_for_job(batch, name, poll_interval)
+    return None
+
+def submit(config, storage, batch, wait=False, poll_interval=30):
+    """Uploads code and inputs, builds the job configuration and submits the job."""
+    upload_code(config, storage)
+    input_env = upload_inputs(config, storage)
+    job_json = build_json(config, input_env)
+    return submit_job(batch, config['JOB_TAG'], job_json, wait, poll_interval)
+
+def download(config, storage, seq_ids=None, kinds=None, layers=None, scales=None, parallel=8):
+    """
+    Downloads the output of a job into JOB_DIR/output, optionally restricted to some sequences, output kinds,
+    layers and scales. Files that already match locally are skipped, and partial downloads are resumed.
+    """
+    remote_dir = f"{job_remote_dir(config)}/output"
+    local_dir = os.path.join(config['JOB_DIR'], 'output')
+    counts = download_outputs(storage, remote_dir, local_dir, seq_ids, kinds, layers, scales, parallel)
+    print(f"downloaded {counts['downloaded']} files to {local_dir} ({counts['skipped']} up to date, {counts['failed']} failed)")
+    if counts['failed']:
+        raise IOError(f"{counts['failed']} files failed to download, run download again to resume")
+    return local_dir
+
+def show(config, storage):
+    """Returns the remote paths of all files in the job directory."""
+    return sorted(storage.list(job_remote_dir(config) + '/'))
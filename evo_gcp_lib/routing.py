@@ -0,0 +1,63 @@
+import gzip
+
+# long context model -> [(model, max_length)], the short context base model is used for sequences
+# within its trained context, the long context model for the rest
+ROUTES = {
+    'evo2_7b': [('evo2_7b_base', 8192), ('evo2_7b', None)],
+    'evo2_40b': [('evo2_40b_base', 8192), ('evo2_40b', None)]
+}
+
+def format_routes(routes):
+    """Formats routes as the MODEL_ROUTES string read by run_evo.py, e.g. 'evo2_7b_base:8192,evo2_7b'."""
+    return ",".join(model_name if max_length is None else f"{model_name}:{max_length}"
+                    for model_name, max_length in routes)
+
+def read_fasta_lengths(fasta_file):
+    """Returns the sequence lengths of a (possibly gzipped) FASTA file, reading it line by line."""
+    opener = gzip.open if fasta_file.endswith('.gz') else open
+    lengths = []
+    with opener(fasta_file, 'rt') as f:
+        for line in f:
+            if line.startswith('>'):
+                lengths.append(0)
+            elif lengths:
+                lengths[-1] += len(line.strip())
+    return lengths
+
+def route_job(config):
+    """
+    Returns the config overrides that route a job by sequence length (MODEL_ROUTING=length).
+    If all sequences fit the short context model, the job runs the short model on the SHORT_* machine.
+    Otherwise MODEL_ROUTES is set, and the job processes each length range with its model in turn.
+    In generate mode, the prompt plus the generated tokens must fit, and the job is never split between models.
+    """
+    if config.get('MODEL_ROUTING', 'none') != 'length':
+        return {}
+    model_name = config['MODEL_NAME']
+    if model_name not in ROUTES:
+        print(f"no length routes for model {model_name}, routing disabled")
+        return {}
+
+    routes = ROUTES[model_name]
+    lengths = read_fasta_lengths(config['INPUT_FASTA'])
+    generate = config.get('RUN_MODE', 'score') == 'generate'
+    if generate:
+        lengths = [length + int(config.get('GENERATE_TOKENS', '500')) for length in lengths]
+    short_model, short_length = routes[0]
+    if lengths and max(lengths) <= short_length:
+        print(f"all {len(lengths)} sequences fit {short_model} (up to {short_length}), using it on {config['SHORT_MACHINE_TYPE']}")
+        return {
+            'MODEL_NAME': short_model,
+            'MACHINE_TYPE': config['SHORT_MACHINE_TYPE'],
+            'ACCELERATOR_TYPE': config['SHORT_ACCELERATOR_TYPE'],
+            'ACCELERATOR_COUNT': config['SHORT_ACCELERATOR_COUNT']
+        }
+
+    short_count = sum(1 for length in lengths if length <= short_length)
+    if short_count == 0:
+        return {}
+    if generate:
+        print(f"{len(lengths) - short_count} prompts do not fit {short_model} with the generated tokens, using {model_name}")
+        return {}
+    print(f"routing {short_count} sequences to {short_model} and {len(lengths) - short_count} to {model_name}")
+    return {'MODEL_ROUTES': format_routes(routes)}
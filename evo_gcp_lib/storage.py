@@ -0,0 +1,139 @@
+import base64
+import hashlib
+import os
+import shutil
+
+def file_md5(path, chunk_size=1 << 20):
+    """Returns the base64-encoded MD5 of a file, as reported by GCS."""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+    return base64.b64encode(md5.digest()).decode('ascii')
+
+def list_local_files(local_dir):
+    """Returns the relative paths of all files under a local directory."""
+    paths = []
+    for root, dirs, files in os.walk(local_dir):
+        dirs[:] = [d for d in dirs if d != "__pycache__"]
+        for name in files:
+            paths.append(os.path.relpath(os.path.join(root, name), local_dir).replace(os.sep, '/'))
+    return sorted(paths)
+
+class GcsStorage:
+    """Google Cloud Storage bucket, accessed in-process with the google-cloud-storage client."""
+
+    def __init__(self, bucket_name, project=None):
+        self.bucket_name = bucket_name
+        self.project = project or None
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google.cloud import storage
+            self._client = storage.Client(project=self.project)
+        return self._client
+
+    @property
+    def bucket(self):
+        return self.client.bucket(self.bucket_name)
+
+    def url(self, remote_path=''):
+        return f"gs://{self.bucket_name}/{remote_path}"
+
+    def bucket_exists(self):
+        return self.client.lookup_bucket(self.bucket_name) is not None
+
+    def create_bucket(self, location):
+        self.client.create_bucket(self.bucket_name, location=location)
+
+    def upload_file(self, local_path, remote_path):
+        self.bucket.blob(remote_path).upload_from_filename(local_path)
+
+    def md5(self, remote_path):
+        """Returns the base64 MD5 of a remote file, or None if it does not exist."""
+        blob = self.bucket.get_blob(remote_path)
+        return blob.md5_hash if blob is not None else None
+
+    def list(self, prefix):
+        """Returns {remote_path: md5} for all files under a prefix."""
+        return {blob.name: blob.md5_hash for blob in self.client.list_blobs(self.bucket_name, prefix=prefix)}
+
+    def read_bytes(self, remote_path):
+        return self.bucket.blob(remote_path).download_as_bytes()
+
+    def read_range(self, remote_path, start, end):
+        """Returns bytes [start, end) of a remote file."""
+        return self.bucket.blob(remote_path).download_as_bytes(start=start, end=end - 1)
+
+    def download_file(self, remote_path, local_path):
+        self.bucket.blob(remote_path).download_to_filename(local_path)
+
+class LocalStorage:
+    """A local directory standing in for the bucket, for offline runs and testing."""
+
+    def __init__(self, root_dir):
+        self.root_dir = os.path.abspath(root_dir)
+
+    def path(self, remote_path):
+        return os.path.join(self.root_dir, *remote_path.split('/'))
+
+    def url(self, remote_path=''):
+        return self.path(remote_path)
+
+    def bucket_exists(self):
+        return os.path.isdir(self.root_dir)
+
+    def create_bucket(self, location):
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def upload_file(self, local_path, remote_path):
+        os.makedirs(os.path.dirname(self.path(remote_path)), exist_ok=True)
+        shutil.copyfile(local_path, self.path(remote_path))
+
+    def md5(self, remote_path):
+        path = self.path(remote_path)
+        return file_md5(path) if os.path.isfile(path) else None
+
+    def list(self, prefix):
+        base = self.path(prefix.rstrip('/'))
+        if os.path.isfile(base):
+            return {prefix: file_md5(base)}
+        if not os.path.isdir(base):
+            return {}
+        return {f"{prefix.rstrip('/')}/{rel}": file_md5(os.path.join(base, rel)) for rel in list_local_files(base)}
+
+    def read_bytes(self, remote_path):
+        with open(self.path(remote_path), 'rb') as f:
+            return f.read()
+
+    def read_range(self, remote_path, start, end):
+        with open(self.path(remote_path), 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def download_file(self, remote_path, local_path):
+        shutil.copyfile(self.path(remote_path), local_path)
+
+def sync_dir(storage, local_dir, remote_prefix):
+    """Uploads files of a local directory whose content differs from the remote copy (like gsutil rsync)."""
+    remote = storage.list(remote_prefix + '/')
+    uploaded = 0
+    for rel in list_local_files(local_dir):
+        remote_path = f"{remote_prefix}/{rel}"
+        local_path = os.path.join(local_dir, rel)
+        if remote.get(remote_path) != file_md5(local_path):
+            storage.upload_file(local_path, remote_path)
+            uploaded += 1
+    return uploaded
+
+def download_prefix(storage, remote_prefix, local_dir):
+    """Downloads all files under a remote prefix into a local directory, returns the number of files."""
+    remote_prefix = remote_prefix.rstrip('/') + '/'
+    remote = storage.list(remote_prefix)
+    for remote_path in remote:
+        local_path = os.path.join(local_dir, *remote_path[len(remote_prefix):].split('/'))
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        storage.download_file(remote_path, local_path)
+    return len(remote)
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import threading
+
+from .storage import list_local_files, sync_dir
+
+# remote directory for content-addressed job inputs
+INPUTS_DIR = "inputs"
+
+# open manifests, shared by all jobs of a process
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+def file_sha256(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class UploadManifest:
+    """
+    Local cache of file hashes by size and modification time, so that unchanged code and inputs
+    are not hashed again. Whether content is already uploaded is always checked against the bucket,
+    since the bucket can be changed from other machines or recreated.
+    A manifest with path None caches hashes only for the running process.
+    Uploads to the same remote path are serialized, so that concurrent jobs sharing code or an input
+    upload it once and the others find it in the bucket.
+    """
+
+    def __init__(self, path, bucket_url):
+        self.path = path
+        self.bucket_url = bucket_url
+        self.lock = threading.Lock()
+        self.path_locks = {}
+        self.data = {'hashes': {}}
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.data = {'hashes': json.load(f).get('hashes', {})}
+
+    def hash_file(self, path):
+        """Returns the sha256 of a file, reusing the cached value if the file is unchanged."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = f"{stat.st_size}:{stat.st_mtime_ns}"
+        with self.lock:
+            cached = self.data['hashes'].get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        digest = file_sha256(path)
+        with self.lock:
+            self.data['hashes'][path] = [key, digest]
+        return digest
+
+    def path_lock(self, remote_path):
+        """Returns the lock held while a remote path is checked and uploaded."""
+        with self.lock:
+            return self.path_locks.setdefault(remote_path, threading.Lock())
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.data, f)
+            os.replace(tmp_path, self.path)
+
+def get_manifest(config, storage):
+    """Returns the upload manifest of a storage, as set by UPLOAD_MANIFEST (none disables it)."""
+    path = config.get('UPLOAD_MANIFEST', 'none')
+    path = None if path == 'none' else os.path.abspath(path)
+    key = (path, storage.url())
+    with _manifests_lock:
+        if key not in _manifests:
+            _manifests[key] = UploadManifest(path, storage.url())
+        return _manifests[key]
+
+def upload_dir_cached(storage, manifest, local_dir, remote_dir):
+    """
+    Syncs a directory to the bucket, uploading only files whose MD5 differs from the bucket copy.
+    The comparison is against a single listing of the bucket, so unchanged directories cost one request.
+    """
+    with manifest.path_lock(remote_dir):
+        count = sync_dir(storage, local_dir, remote_dir)
+    if count:
+        print(f"synced {local_dir} to {storage.url(remote_dir)} ({count} files uploaded)")
+    else:
+        print(f"{local_dir} unchanged in {storage.url(remote_dir)}, skipping upload")
+    return count
+
+def upload_content_addressed(storage, manifest, local_path, name):
+    """
+    Uploads a file once under inputs/<sha256>/<name> and returns its remote path.
+    Identical files are shared by all jobs.
+    """
+    digest = manifest.hash_file(local_path)
+    manifest.save()
+    remote_path = f"{INPUTS_DIR}/{digest}/{name}"
+    with manifest.path_lock(remote_path):
+        if storage.md5(remote_path) is None:
+            storage.upload_file(local_path, remote_path)
+            print(f"uploaded {local_path} to {storage.url(remote_path)}")
+        else:
+            print(f"{local_path} already uploaded to {storage.url(remote_path)}")
+    return remote_path
@@ -118,7 +118,18 @@ env:
 		-e JOB_TAG=$(JOB_TAG) \
 		-e MODEL_NAME=$(MODEL_NAME) \
 		-e OUTPUT_TYPE=$(OUTPUT_TYPE) \
+		-e STRAND_MODE=$(STRAND_MODE) \
+		-e OUTPUT_PRECISION=$(OUTPUT_PRECISION) \
+		-e OUTPUT_COMPRESSION=$(OUTPUT_COMPRESSION) \
+		-e RUN_MODE=$(RUN_MODE) \
+		-e GENERATE_TOKENS=$(GENERATE_TOKENS) \
+		-e GENERATE_SAMPLES=$(GENERATE_SAMPLES) \
+		-e GENERATE_TEMPERATURE=$(GENERATE_TEMPERATURE) \
+		-e GENERATE_TOP_K=$(GENERATE_TOP_K) \
+		-e GENERATE_BATCH_SIZE=$(GENERATE_BATCH_SIZE) \
 		-e EMBEDDING_LAYERS="$(EMBEDDING_LAYERS)" \
+		-e SNAPSHOT_BLOCK=$(SNAPSHOT_BLOCK) \
+		-e PROGRESS_INTERVAL=$(PROGRESS_INTERVAL) \
 		-e MACHINE_TYPE=$(MACHINE_TYPE) \
 		-e ACCELERATOR_TYPE=$(ACCELERATOR_TYPE) \
 		-e ACCELERATOR_COUNT=$(ACCELERATOR_COUNT) \
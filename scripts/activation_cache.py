@@ -0,0 +1,153 @@
+import hashlib
+import os
+import re
+import shutil
+
+import numpy as np
+
+def layer_block_index(layer_name):
+    """Returns N for layers inside blocks.N (e.g. 'blocks.28.mlp.l3'), None for other layers."""
+    match = re.match(r'^blocks\.(\d+)(\.|$)', layer_name)
+    return int(match.group(1)) if match else None
+
+def runs_after_block(layer_name, block_index):
+    """True if a layer runs after the output of blocks.<block_index>, i.e. in a later block or the final norm/unembed."""
+    index = layer_block_index(layer_name)
+    if index is not None:
+        return index > block_index
+    return layer_name.split('.')[0] in ('norm', 'unembed')
+
+class ActivationCache:
+    """
+    On-disk cache of hidden states, one .npy file per input keyed by the SHA-256 of its token IDs.
+    The cache is on local disk, where files are written and read as memory maps and moved to the
+    device with a single copy, without a copy in host memory.
+    With sync_dir (e.g. a directory on the bucket mount), snapshots are copied there once complete,
+    and snapshots missing locally are copied from there before they are mapped.
+    bfloat16 states are stored as their raw 16 bits (uint16), like bfloat16 outputs.
+    """
+
+    def __init__(self, cache_dir, sync_dir=None):
+        self.cache_dir = cache_dir
+        self.sync_dir = sync_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        if sync_dir:
+            os.makedirs(sync_dir, exist_ok=True)
+
+    def key(self, input_ids):
+        tokens = input_ids.detach().to('cpu').contiguous().numpy().astype(np.int32)
+        digest = hashlib.sha256(str(tokens.shape).encode())
+        digest.update(tokens.tobytes())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def load(self, key, device):
+        """Returns the cached hidden state as a tensor on device, or None if not cached."""
+        import torch
+        path = self.path(key)
+        if not os.path.exists(path) and not self.fetch(key):
+            return None
+        # copy-on-write mapping, writable for torch.from_numpy but never written
+        data = np.load(path, mmap_mode='c')
+        if data.dtype == np.uint16:
+            return torch.from_numpy(data.view(np.int16)).to(device).view(torch.bfloat16)
+        return torch.from_numpy(data).to(device)
+
+    def fetch(self, key):
+        """Copies a snapshot from sync_dir to the local cache, returns False if it is not there."""
+        if not self.sync_dir:
+            return False
+        sync_path = os.path.join(self.sync_dir, os.path.basename(self.path(key)))
+        if not os.path.exists(sync_path):
+            return False
+        tmp_path = self.path(key) + '.tmp'
+        shutil.copyfile(sync_path, tmp_path)
+        os.replace(tmp_path, self.path(key))
+        return True
+
+    def save(self, key, hidden):
+        """Writes a hidden state to a memory-mapped file, renamed into place once complete."""
+        import torch
+        hidden = hidden.detach()
+        if hidden.dtype == torch.bfloat16:
+            data = hidden.view(torch.int16).cpu().numpy().view(np.uint16)
+        else:
+            data = hidden.cpu().numpy()
+        tmp_path = self.path(key) + '.tmp'
+        mapped = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=data.dtype, shape=data.shape)
+        mapped[...] = data
+        mapped.flush()
+        del mapped
+        os.replace(tmp_path, self.path(key))
+        # a plain sequential copy, the bucket object is only created once the copy is closed
+        if self.sync_dir:
+            shutil.copyfile(self.path(key), os.path.join(self.sync_dir, os.path.basename(self.path(key))))
+
+class ActivationSnapshot:
+    """
+    Runs a StripedHyena-style model (embedding_layer, blocks, norm, unembed) with a snapshot of the
+    output of blocks.<block_index>. The first run of an input saves the snapshot while running the full
+    model; later runs of the same input load it and run only blocks N+1 onward, the final norm and the unembedding.
+    Hooks registered on later layers (steering) apply in both cases.
+    """
+
+    def __init__(self, model, block_index, cache, log=print):
+        if not 0 <= block_index < len(model.blocks) - 1:
+            raise ValueError(f"snapshot block {block_index} out of range, the model has {len(model.blocks)} blocks")
+        self.model = model
+        self.block_index = block_index
+        self.cache = cache
+        self.log = log
+        self.hits = 0
+        self.misses = 0
+
+    def forward(self, input_ids, layer_names=None):
+        """Returns (logits [S, L, V], embeddings {layer: tensor}) like Evo2.forward, with snapshot reuse."""
+        import torch
+
+        embeddings = {}
+        handles = []
+        for layer_name in layer_names or []:
+            module = self.model.get_submodule(layer_name)
+            handles.append(module.register_forward_hook(self.embedding_hook(embeddings, layer_name)))
+
+        key = self.cache.key(input_ids)
+        try:
+            with torch.no_grad():
+                hidden = self.cache.load(key, self.block_device(self.block_index + 1))
+                if hidden is not None:
+                    self.hits += 1
+                    logits = self.resume(hidden)
+                else:
+                    self.misses += 1
+                    captured = {}
+                    handles.append(self.model.blocks[self.block_index].register_forward_hook(
+                        self.embedding_hook(captured, 'snapshot')))
+                    logits = self.model.forward(input_ids)[0]
+                    self.cache.save(key, captured['snapshot'])
+        finally:
+            for handle in handles:
+                handle.remove()
+        return logits, embeddings
+
+    def resume(self, hidden):
+        """Runs the model from the snapshot: blocks N+1 onward, then the final norm and unembedding."""
+        x = hidden
+        for block_index in range(self.block_index + 1, len(self.model.blocks)):
+            x = x.to(self.block_device(block_index))
+            x, _ = self.model.blocks[block_index](x, inference_params=None, padding_mask=None)
+        x = self.model.norm(x)
+        unembed = getattr(self.model.unembed, 'unembed', self.model.unembed)
+        return unembed(x)
+
+    def block_device(self, block_index):
+        # blocks may be split over several devices
+        return next(self.model.blocks[block_index].parameters()).device
+
+    @staticmethod
+    def embedding_hook(store, name):
+        def hook_fn(module, input, output):
+            store[name] = (output[0] if isinstance(output, tuple) else output).detach()
+        return hook_fn
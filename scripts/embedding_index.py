@@ -0,0 +1,338 @@
+import argparse
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+
+from output_codec import load_array
+from output_index import INDEX_FILE
+
+# pooling of per-position embeddings [L, D] (or [2, L, D] in both-strands mode) into one vector
+POOLINGS = ['mean', 'max', 'last']
+
+# rows compared per matrix multiplication in exact search
+BLOCK_ROWS = 65536
+
+# rows sampled to train the IVF centroids
+IVF_TRAIN_ROWS = 100000
+
+META_FILE = 'meta.json'
+VECTORS_FILE = 'vectors.f32'
+ROWS_FILE = 'rows.tsv'
+CENTROIDS_FILE = 'centroids.npy'
+LISTS_FILE = 'lists.i32'
+IVF_ORDER_FILE = 'ivf_order.i64'
+IVF_OFFSETS_FILE = 'ivf_offsets.npy'
+
+def pool_embeddings(embeddings, pooling):
+    """Pools positions (and strands, if present) into a single vector."""
+    if pooling == 'mean':
+        vector = embeddings.mean(axis=-2)
+    elif pooling == 'max':
+        vector = embeddings.max(axis=-2)
+    elif pooling == 'last':
+        vector = embeddings[..., -1, :]
+    else:
+        raise ValueError(f"unknown pooling: {pooling}")
+    # average the plus and minus strands
+    if vector.ndim == 2:
+        vector = vector.mean(axis=0)
+    return vector.astype(np.float32)
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+def find_embedding_files(output_dir, layer, scale):
+    """
+    Returns [(seq_id, path)] of the embedding files of a layer and scale in a job output directory.
+    Uses the output index if present, otherwise the processed IDs and file names.
+    """
+    index_path = os.path.join(output_dir, INDEX_FILE)
+    if os.path.exists(index_path):
+        files = []
+        with open(index_path, 'r') as f:
+            header = f.readline().rstrip('\n').split('\t')
+            for line in f:
+                row = dict(zip(header, line.rstrip('\n').split('\t')))
+                if row['kind'] == 'embeddings' and row['layer'] == layer and row['scale'] == scale:
+                    files.append((row['seq_id'], os.path.join(output_dir, row['file'])))
+        return files
+
+    files = []
+    safe_layer_name = layer.replace('.', '_')
+    for ids_path in glob.glob(os.path.join(output_dir, '*_processed_ids.txt')):
+        basename = os.path.basename(ids_path)[:-len('_processed_ids.txt')]
+        with open(ids_path, 'r') as f:
+            seq_ids = [line.strip() for line in f if line.strip()]
+        for seq_id in seq_ids:
+            seq_id_safe_filename = "".join(c if c.isalnum() else "_" for c in seq_id)
+            prefix = f"{basename}_{seq_id_safe_filename}_embeddings_{safe_layer_name}_{scale}"
+            matches = glob.glob(os.path.join(output_dir, glob.escape(prefix) + '.np*'))
+            if matches:
+                files.append((seq_id, matches[0]))
+    return files
+
+class EmbeddingIndex:
+    """
+    Persistent index of unit-normalized pooled embeddings in a directory:
+    vectors.f32 (appended float32 rows, read as a memory map), rows.tsv (job and seq_id of each row)
+    and meta.json. An optional IVF layer restricts queries to the rows of the lists nearest to the query:
+    centroids.npy, the list of every row (lists.i32), and the rows present at build time sorted by list
+    (ivf_order.i64) with the start of each list (ivf_offsets.npy), so that a list is read as one range.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.meta = None
+        meta_path = os.path.join(index_dir, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                self.meta = json.load(f)
+
+    def file(self, name):
+        return os.path.join(self.index_dir, name)
+
+    @property
+    def count(self):
+        return self.meta['count'] if self.meta else 0
+
+    def vectors(self):
+        if not self.count:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.memmap(self.file(VECTORS_FILE), dtype=np.float32, mode='r', shape=(self.count, self.meta['dim']))
+
+    def rows(self):
+        with open(self.file(ROWS_FILE), 'r') as f:
+            return [line.rstrip('\n').split('\t') for line in f]
+
+    def centroids(self):
+        path = self.file(CENTROIDS_FILE)
+        return np.load(path) if os.path.exists(path) else None
+
+    def ivf_lists(self):
+        """
+        Returns (order, offsets, tail_lists): the rows present at build_ivf sorted by list (memory mapped),
+        the start of each list in order, and the lists of the rows added after build_ivf.
+        """
+        if 'ivf_count' not in self.meta:
+            raise ValueError(f"IVF lists of {self.index_dir} are from an older version, run build_ivf again")
+        built = self.meta['ivf_count']
+        order = np.memmap(self.file(IVF_ORDER_FILE), dtype=np.int64, mode='r', shape=(built,))
+        offsets = np.load(self.file(IVF_OFFSETS_FILE))
+        tail_lists = np.fromfile(self.file(LISTS_FILE), dtype=np.int32, count=self.count - built, offset=4 * built)
+        return order, offsets, tail_lists
+
+    def save_meta(self):
+        tmp_path = self.file(META_FILE) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp_path, self.file(META_FILE))
+
+    def add(self, job, entries, layer, scale, pooling):
+        """
+        Appends (seq_id, vector) entries of a job. Entries already in the index (same job and seq_id) are skipped.
+        Returns the number of rows added.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        if self.meta is None:
+            if not entries:
+                return 0
+            self.meta = {'dim': int(entries[0][1].shape[-1]), 'count': 0, 'layer': layer, 'scale': scale, 'pooling': pooling}
+        elif (self.meta['layer'], self.meta['scale'], self.meta['pooling']) != (layer, scale, pooling):
+            raise ValueError(f"index holds {self.meta['layer']} ({self.meta['scale']}, {self.meta['pooling']} pooling), "
+                             f"cannot add {layer} ({scale}, {pooling} pooling)")
+
+        self.discard_incomplete()
+        existing = {(row[0], row[1]) for row in self.rows()} if self.count else set()
+        entries = [(seq_id, vector) for seq_id, vector in entries if (job, seq_id) not in existing]
+        if not entries:
+            return 0
+        vectors = normalize(np.stack([vector for _, vector in entries]).astype(np.float32))
+        if vectors.shape[1] != self.meta['dim']:
+            raise ValueError(f"embedding dimension {vectors.shape[1]} differs from the index ({self.meta['dim']})")
+
+        with open(self.file(VECTORS_FILE), 'ab') as f:
+            f.write(vectors.tobytes())
+        with open(self.file(ROWS_FILE), 'a') as f:
+            for seq_id, _ in entries:
+                f.write(f"{job}\t{seq_id}\n")
+        centroids = self.centroids()
+        if centroids is not None:
+            with open(self.file(LISTS_FILE), 'ab') as f:
+                f.write(np.argmax(vectors @ centroids.T, axis=1).astype(np.int32).tobytes())
+        # the count is updated last, so rows of an interrupted append are ignored
+        self.meta['count'] += len(entries)
+        self.save_meta()
+        return len(entries)
+
+    def discard_incomplete(self):
+        """Truncates the data files to the committed row count, dropping rows of an interrupted append."""
+        for name, row_bytes in [(VECTORS_FILE, 4 * self.meta['dim']), (LISTS_FILE, 4)]:
+            path = self.file(name)
+            if os.path.exists(path) and os.path.getsize(path) > self.count * row_bytes:
+                with open(path, 'r+b') as f:
+                    f.truncate(self.count * row_bytes)
+        if os.path.exists(self.file(ROWS_FILE)):
+            rows = self.rows()
+            if len(rows) > self.count:
+                with open(self.file(ROWS_FILE), 'w') as f:
+                    for row in rows[:self.count]:
+                        f.write("\t".join(row) + "\n")
+
+    def build_ivf(self, n_lists, iterations=10, seed=0):
+        """
+        Trains spherical k-means centroids on a sample of the vectors, assigns every row to a list
+        and stores the rows sorted by list.
+        """
+        if not self.count:
+            raise ValueError(f"index {self.index_dir} is empty")
+        if not 1 <= n_lists <= self.count:
+            raise ValueError(f"n_lists must be between 1 and the number of indexed sequences ({self.count}), got {n_lists}")
+        vectors = self.vectors()
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(vectors[np.sort(rng.choice(self.count, min(self.count, IVF_TRAIN_ROWS), replace=False))])
+        n_lists = min(n_lists, len(sample))
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = normalize(centroids)
+        lists = np.concatenate([np.argmax(np.asarray(vectors[start:start + BLOCK_ROWS]) @ centroids.T, axis=1)
+                                for start in range(0, self.count, BLOCK_ROWS)]).astype(np.int32)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=n_lists))])
+
+        np.save(self.file(CENTROIDS_FILE), centroids)
+        lists.tofile(self.file(LISTS_FILE))
+        np.argsort(lists, kind='stable').astype(np.int64).tofile(self.file(IVF_ORDER_FILE))
+        np.save(self.file(IVF_OFFSETS_FILE), offsets)
+        self.meta['ivf_count'] = self.count
+        self.save_meta()
+        return n_lists
+
+    def search(self, queries, k=10, n_probe=None):
+        """
+        Returns (similarities, row indices), each [Q, k], of the top-k cosine neighbours of each query.
+        Exact search scans the vectors in blocks; with n_probe and an IVF layer only the rows of the
+        n_probe lists nearest to each query are compared.
+        """
+        queries = normalize(np.atleast_2d(queries).astype(np.float32))
+        vectors = self.vectors()
+        k = min(k, self.count)
+        centroids = self.centroids() if n_probe else None
+
+        if centroids is None:
+            best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+            best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+            for start in range(0, self.count, BLOCK_ROWS):
+                scores = queries @ np.asarray(vectors[start:start + BLOCK_ROWS]).T
+                rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+                best_scores, best_rows = top_k(np.hstack([best_scores, scores]), np.hstack([best_rows, rows]), k)
+            return best_scores, best_rows
+
+        order, offsets, tail_lists = self.ivf_lists()
+        all_scores, all_rows = [], []
+        for query in queries:
+            probe = np.argsort(-(centroids @ query))[:n_probe]
+            # only the ranges of the probed lists are read, rows added after build_ivf are matched by their list
+            ranges = [np.asarray(order[offsets[c]:offsets[c + 1]]) for c in probe]
+            ranges.append(len(order) + np.flatnonzero(np.isin(tail_lists, probe)))
+            candidates = np.sort(np.concatenate(ranges))
+            scores = np.asarray(vectors[candidates]) @ query
+            scores, rows = top_k(scores[np.newaxis], candidates[np.newaxis], min(k, len(candidates)))
+            all_scores.append(np.pad(scores[0], (0, k - scores.shape[1]), constant_values=np.nan))
+            all_rows.append(np.pad(rows[0], (0, k - rows.shape[1]), constant_values=-1))
+        return np.stack(all_scores), np.stack(all_rows)
+
+def top_k(scores, rows, k):
+    """Keeps the k highest scores of each row, sorted in decreasing order."""
+    if scores.shape[1] > k:
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores, rows = np.take_along_axis(scores, keep, 1), np.take_along_axis(rows, keep, 1)
+    order = np.argsort(-scores, axis=1)
+    return np.take_along_axis(scores, order, 1), np.take_along_axis(rows, order, 1)
+
+def read_job_embeddings(output_dir, layer, scale, pooling, seq_ids=None):
+    """Returns [(seq_id, pooled vector)] of a job output directory."""
+    entries = []
+    for seq_id, path in find_embedding_files(output_dir, layer, scale):
+        if seq_ids and seq_id not in seq_ids:
+            continue
+        entries.append((seq_id, pool_embeddings(load_array(path), pooling)))
+    return entries
+
+def write_neighbours(f, queries, similarities, row_indices, rows):
+    f.write("query_id\trank\tjob\tseq_id\tcosine_similarity\n")
+    for (query_id, _), scores, row_ids in zip(queries, similarities, row_indices):
+        for rank, (score, row_id) in enumerate(zip(scores, row_ids), 1):
+            if row_id < 0:
+                continue
+            job, seq_id = rows[row_id]
+            f.write(f"{query_id}\t{rank}\t{job}\t{seq_id}\t{score:.6f}\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Nearest-neighbour index of pooled per-sequence embeddings across jobs.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help="Append the embeddings of a job output directory to an index.")
+    add_parser.add_argument('--index_dir', required=True, help="Index directory (created if missing).")
+    add_parser.add_argument('--output_dir', required=True, help="Job output directory (e.g. jobs/my-job-v1/output).")
+    add_parser.add_argument('--job', default=None, help="Job name recorded for each row. Defaults to the output directory's parent name.")
+    add_parser.add_argument('--layer', default='blocks.28.mlp.l3', help="Embedding layer. Default: blocks.28.mlp.l3")
+    add_parser.add_argument('--scale', default='unsteered', help="Scale name of the embeddings. Default: unsteered")
+    add_parser.add_argument('--pooling', choices=POOLINGS, default='mean', help="Pooling over positions. Default: mean")
+
+    ivf_parser = subparsers.add_parser('build_ivf', help="Train IVF lists for approximate queries.")
+    ivf_parser.add_argument('--index_dir', required=True, help="Index directory.")
+    ivf_parser.add_argument('--n_lists', type=int, default=256, help="Number of IVF lists. Default: 256")
+
+    query_parser = subparsers.add_parser('query', help="Find the nearest indexed sequences of the sequences of a job.")
+    query_parser.add_argument('--index_dir', required=True, help="Index directory.")
+    query_parser.add_argument('--output_dir', required=True, help="Job output directory with the query embeddings.")
+    query_parser.add_argument('--seq_ids', default=None, help="Comma-separated query sequence IDs (default: all).")
+    query_parser.add_argument('--k', type=int, default=10, help="Number of neighbours per query. Default: 10")
+    query_parser.add_argument('--n_probe', type=int, default=None,
+                              help="Approximate search over the n_probe nearest IVF lists (requires build_ivf). Default: exact")
+    query_parser.add_argument('--output_file', default=None, help="Output table. Defaults to standard output.")
+
+    args = parser.parse_args()
+    index = EmbeddingIndex(args.index_dir)
+
+    if args.command == 'add':
+        job = args.job or os.path.basename(os.path.dirname(os.path.abspath(args.output_dir)))
+        entries = read_job_embeddings(args.output_dir, args.layer, args.scale, args.pooling)
+        if not entries:
+            print(f"no {args.layer} embeddings ({args.scale}) found in {args.output_dir}")
+            return
+        added = index.add(job, entries, args.layer, args.scale, args.pooling)
+        print(f"added {added} of {len(entries)} sequences of {job}, index has {index.count} sequences")
+
+    elif args.command == 'build_ivf':
+        try:
+            n_lists = index.build_ivf(args.n_lists)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"built {n_lists} IVF lists over {index.count} sequences")
+
+    elif args.command == 'query':
+        if not index.count:
+            parser.error(f"index {args.index_dir} is empty")
+        seq_ids = set(args.seq_ids.split(',')) if args.seq_ids else None
+        queries = read_job_embeddings(args.output_dir, index.meta['layer'], index.meta['scale'],
+                                      index.meta['pooling'], seq_ids)
+        if not queries:
+            parser.error(f"no query embeddings found in {args.output_dir}")
+        similarities, row_indices = index.search(np.stack([vector for _, vector in queries]), args.k, args.n_probe)
+        if args.output_file:
+            with open(args.output_file, 'w') as f:
+                write_neighbours(f, queries, similarities, row_indices, index.rows())
+        else:
+            write_neighbours(sys.stdout, queries, similarities, row_indices, index.rows())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import time
+
+# line width of generated FASTA records
+FASTA_LINE_WIDTH = 80
+
+def generation_batches(prompts, n_samples, batch_size):
+    """
+    Groups the (prompt index, sample index) pairs of all prompts x samples into batches.
+    Only prompts of equal length share a batch, since the batched inference cache is not padded.
+    """
+    by_length = {}
+    for i, prompt in enumerate(prompts):
+        by_length.setdefault(len(prompt), []).append(i)
+
+    batches = []
+    for length in sorted(by_length, reverse=True):
+        items = [(i, k) for i in by_length[length] for k in range(n_samples)]
+        for start in range(0, len(items), batch_size):
+            batches.append(items[start:start + batch_size])
+    return batches
+
+def write_fasta_record(f, record_id, sequence, width=FASTA_LINE_WIDTH):
+    f.write(f">{record_id}\n")
+    for start in range(0, len(sequence), width):
+        f.write(sequence[start:start + width] + "\n")
+
+def out_of_memory_error():
+    """Returns the exception type raised when the device runs out of memory."""
+    try:
+        import torch
+        return torch.cuda.OutOfMemoryError
+    except (ImportError, AttributeError):
+        return MemoryError
+
+def generate_batch(model, prompts, n_tokens, temperature, top_k, log=print):
+    """
+    Generates one continuation per prompt with the model's cached (incremental) generation, so that each
+    new token is a single step over the cached recurrent state instead of a forward pass over the full sequence.
+    A batch that runs out of memory is split in two.
+    """
+    try:
+        output = model.generate(prompt_seqs=prompts, n_tokens=n_tokens, temperature=temperature, top_k=top_k,
+                                batched=True, cached_generation=True, verbose=0)
+        return list(output.sequences)
+    except out_of_memory_error():
+        if len(prompts) == 1:
+            raise
+        from scheduler import free_memory
+        free_memory()
+        half = len(prompts) // 2
+        log(f"      out of memory generating a batch of {len(prompts)}, splitting")
+        return (generate_batch(model, prompts[:half], n_tokens, temperature, top_k, log) +
+                generate_batch(model, prompts[half:], n_tokens, temperature, top_k, log))
+
+def generate_to_fasta(model, prompt_ids, prompts, f, n_samples=1, n_tokens=500,
+                      temperature=1.0, top_k=4, batch_size=8, log=print):
+    """
+    Samples n_samples continuations of n_tokens for each prompt, in batches of prompts x samples.
+    Records are written to the open file f and flushed as each batch completes, as '<prompt_id>_sample<k>'
+    with the generated continuation (without the prompt).
+    model is any object with an Evo2-like generate(prompt_seqs, n_tokens, temperature, top_k, ...) method
+    returning an object with a sequences list. Returns the number of records written.
+    """
+    batches = generation_batches(prompts, n_samples, batch_size)
+    count = 0
+    start_time = time.time()
+    for b, batch in enumerate(batches):
+        sequences = generate_batch(model, [prompts[i] for i, _ in batch], n_tokens, temperature, top_k, log)
+        for (i, k), sequence in zip(batch, sequences):
+            write_fasta_record(f, f"{prompt_ids[i]}_sample{k + 1}", sequence)
+        f.flush()
+        count += len(batch)
+        elapsed = time.time() - start_time
+        log(f"    batch {b + 1}/{len(batches)}: {count} sequences generated "
+            f"({count * n_tokens / max(elapsed, 1e-9):.1f} tokens/sec)")
+    return count
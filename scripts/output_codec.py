@@ -0,0 +1,140 @@
+import argparse
+import io
+import os
+
+import numpy as np
+
+from output_index import ChecksumFile
+
+# storage precisions for logits and embeddings
+PRECISIONS = ['float32', 'bfloat16', 'float16', 'int8']
+
+# block compression applied to saved arrays
+COMPRESSIONS = ['none', 'zstd', 'lz4']
+
+def get_compressor(compression):
+    """Returns (compress, decompress) functions for a compression name."""
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression requires the 'zstandard' package (pip install zstandard)")
+        return (lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+                lambda data: zstandard.ZstdDecompressor().decompress(data))
+    if compression == 'lz4':
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("lz4 compression requires the 'lz4' package (pip install lz4)")
+        return lz4.frame.compress, lz4.frame.decompress
+    raise ValueError(f"unknown compression: {compression}")
+
+def array_suffix(precision, compression):
+    """Returns the file suffix used for a precision/compression combination."""
+    if precision == 'float32' and compression == 'none':
+        return '.npy'
+    if compression == 'none':
+        return '.npz'
+    return f".npz.{compression}"
+
+def encode_tensor(tensor, precision):
+    """
+    Converts a torch tensor to a dict of numpy arrays in the requested precision.
+    The conversion is done on the tensor's device, only the encoded bytes are copied to the host.
+    """
+    import torch
+
+    tensor = tensor.detach()
+    if precision == 'float32':
+        return {'data': tensor.to(torch.float32).cpu().numpy()}
+    if precision == 'float16':
+        return {'data': tensor.to(torch.float16).cpu().numpy()}
+    if precision == 'bfloat16':
+        # numpy has no bfloat16, keep the raw 16 bits as uint16
+        bits = tensor.to(torch.bfloat16).view(torch.int16).cpu().numpy()
+        return {'data': bits.view(np.uint16)}
+    if precision == 'int8':
+        # symmetric quantization with one float32 scale per row (last axis)
+        values = tensor.to(torch.float32)
+        scale = values.abs().amax(dim=-1, keepdim=True) / 127.0
+        scale = torch.where(scale > 0, scale, torch.ones_like(scale))
+        quantized = torch.round(values / scale).clamp(-127, 127).to(torch.int8)
+        return {'data': quantized.cpu().numpy(), 'scale': scale.squeeze(-1).cpu().numpy()}
+    raise ValueError(f"unknown precision: {precision}")
+
+def decode_arrays(arrays, precision):
+    """Converts encoded arrays back to a float32 numpy array."""
+    data = arrays['data']
+    if precision in ('float32', 'float16'):
+        return data.astype(np.float32)
+    if precision == 'bfloat16':
+        return (data.astype(np.uint32) << 16).view(np.float32)
+    if precision == 'int8':
+        return data.astype(np.float32) * arrays['scale'][..., np.newaxis]
+    raise ValueError(f"unknown precision: {precision}")
+
+def save_array(path_base, arrays, precision, compression='none'):
+    """
+    Saves encoded arrays to path_base + suffix and returns the written ChecksumFile
+    (with the full path, size and MD5). Plain float32 output is written as a regular .npy file.
+    """
+    path = path_base + array_suffix(precision, compression)
+    if path.endswith('.npy'):
+        with ChecksumFile(path) as f:
+            np.save(f, arrays['data'])
+        return f
+
+    buffer = io.BytesIO()
+    np.savez(buffer, precision=np.array(precision), **arrays)
+    payload = buffer.getvalue()
+    if compression != 'none':
+        compress, _ = get_compressor(compression)
+        payload = compress(payload)
+    with ChecksumFile(path) as f:
+        f.write(payload)
+    return f
+
+def load_array(path):
+    """Loads an array saved by save_array and returns it as float32."""
+    if path.endswith('.npy'):
+        return np.load(path).astype(np.float32, copy=False)
+
+    with open(path, 'rb') as f:
+        payload = f.read()
+    for compression in COMPRESSIONS[1:]:
+        if path.endswith(f".npz.{compression}"):
+            _, decompress = get_compressor(compression)
+            payload = decompress(payload)
+            break
+    else:
+        if not path.endswith('.npz'):
+            raise ValueError(f"unrecognized output file: {path}")
+
+    with np.load(io.BytesIO(payload)) as archive:
+        arrays = {key: archive[key] for key in archive.files}
+    precision = str(arrays.pop('precision'))
+    return decode_arrays(arrays, precision)
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode a saved logits/embedding file into a float32 .npy file.")
+    parser.add_argument('input_files', nargs='+', help="Encoded files (.npy, .npz, .npz.zstd, .npz.lz4).")
+    parser.add_argument('--output_dir', type=str, default=None,
+                        help="Directory for decoded files. Defaults to the directory of each input file.")
+    args = parser.parse_args()
+
+    for input_file in args.input_files:
+        base = os.path.basename(input_file)
+        for suffix in ['.npz.zstd', '.npz.lz4', '.npz', '.npy']:
+            if base.endswith(suffix):
+                base = base[:-len(suffix)]
+                break
+        output_dir = args.output_dir or os.path.dirname(input_file)
+        output_file = os.path.join(output_dir, f"{base}.npy")
+        if os.path.abspath(output_file) == os.path.abspath(input_file):
+            print(f"skipping {input_file}, already a float32 .npy file")
+            continue
+        np.save(output_file, load_array(input_file))
+        print(f"decoded {input_file} to {output_file}")
+
+if __name__ == "__main__":
+    main()
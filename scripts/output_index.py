@@ -0,0 +1,69 @@
+import base64
+import hashlib
+import os
+
+# name of the index file in the output directory
+INDEX_FILE = 'output_index.tsv'
+
+INDEX_COLUMNS = ['file', 'seq_id', 'kind', 'layer', 'scale', 'size', 'md5']
+
+class ChecksumFile:
+    """
+    Output file that tracks the size and MD5 of the bytes written to it, so that indexed outputs
+    are not read back (through the bucket mount) to checksum them. Text is written as UTF-8.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self._md5 = hashlib.md5()
+        self._file = open(path, 'wb')
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._md5.update(data)
+        self.size += len(data)
+        self._file.write(data)
+        return len(data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def md5(self):
+        """Base64-encoded MD5 of the written bytes, the form reported by GCS."""
+        return base64.b64encode(self._md5.digest()).decode('ascii')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class OutputIndex:
+    """
+    Records the files written to the output directory, with the sequence, kind (summary, logits, ...),
+    layer and scale of each, so that downloads can select files without listing or parsing file names.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.entries = []
+
+    def add(self, output_file, kind, seq_id='', layer='', scale=''):
+        """Adds a written ChecksumFile to the index."""
+        self.entries.append((os.path.basename(output_file.path), seq_id, kind, layer, scale, output_file.size, output_file.md5))
+
+    def write(self):
+        """Writes the index with the size and MD5 of each file, returns its path."""
+        index_path = os.path.join(self.output_dir, INDEX_FILE)
+        with open(index_path, 'w') as f:
+            f.write("\t".join(INDEX_COLUMNS) + "\n")
+            for name, seq_id, kind, layer, scale, size, md5 in self.entries:
+                f.write(f"{name}\t{seq_id}\t{kind}\t{layer}\t{scale}\t{size}\t{md5}\n")
+        print(f"output index with {len(self.entries)} files saved to {index_path}")
+        return index_path
@@ -0,0 +1,208 @@
+import argparse
+import sys
+import time
+
+from scheduler import DEFAULT_CONFIGS_DIR, read_model_config, parse_model_routes
+from activation_cache import layer_block_index
+
+# IUPAC nucleotide codes accepted in input sequences, lowercase (soft-masked) bases are accepted too
+NUCLEOTIDE_ALPHABET = frozenset("ACGTNRYKMSWBDHV")
+
+# bytes per stored value for each output precision
+PRECISION_BYTES = {'float32': 4, 'bfloat16': 2, 'float16': 2, 'int8': 1}
+
+# number of errors listed before the rest are summarized
+MAX_REPORTED_ERRORS = 20
+
+def scan_fasta(fasta_file, errors):
+    """
+    Streams a FASTA file and returns [(seq_id, length)] without keeping the sequences.
+    Appends empty or duplicate IDs, empty sequences and non-IUPAC characters (in either case) to errors.
+    """
+    records = []
+    seen = set()
+    invalid = set()
+    with open(fasta_file, 'r') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if line.startswith('>'):
+                seq_id = line[1:]
+                if not seq_id:
+                    errors.append(f"{fasta_file} line {line_num}: empty sequence ID")
+                elif seq_id in seen:
+                    errors.append(f"{fasta_file} line {line_num}: duplicate sequence ID {seq_id}")
+                seen.add(seq_id)
+                records.append([seq_id, 0])
+                invalid = set()
+            elif line:
+                if not records:
+                    errors.append(f"{fasta_file} line {line_num}: sequence before the first header")
+                    continue
+                records[-1][1] += len(line)
+                bad = {c for c in set(line) if c.upper() not in NUCLEOTIDE_ALPHABET} - invalid
+                if bad:
+                    invalid |= bad
+                    errors.append(f"{fasta_file} line {line_num}: sequence {records[-1][0]} has invalid characters "
+                                  f"{''.join(sorted(bad))} (expected IUPAC nucleotides)")
+    for seq_id, length in records:
+        if length == 0:
+            errors.append(f"{fasta_file}: sequence {seq_id} is empty")
+    return [(seq_id, length) for seq_id, length in records]
+
+def scan_query_table(query_table_file, lengths, errors):
+    """Checks the query table format and that each range is within its sequence, returns {seq_id: (start, end)}."""
+    query_data = {}
+    with open(query_table_file, 'r') as f:
+        header = f.readline().strip()
+        if header != "seq_id\tstart\tend":
+            errors.append(f"{query_table_file}: expected header 'seq_id\\tstart\\tend', got '{header}'")
+            return query_data
+        for line_num, line in enumerate(f, 2):
+            line = line.strip()
+            if not line:
+                continue
+            parts = line.split('\t')
+            if len(parts) != 3:
+                errors.append(f"{query_table_file} line {line_num}: expected 3 columns, got {len(parts)}")
+                continue
+            seq_id = parts[0]
+            try:
+                start, end = int(parts[1]), int(parts[2])
+            except ValueError:
+                errors.append(f"{query_table_file} line {line_num}: invalid coordinates {parts[1]}-{parts[2]}")
+                continue
+            if seq_id in query_data:
+                errors.append(f"{query_table_file} line {line_num}: duplicate sequence ID {seq_id}")
+            if seq_id not in lengths:
+                errors.append(f"{query_table_file} line {line_num}: sequence {seq_id} is not in the FASTA file")
+            elif start < 1 or start > end or end > lengths[seq_id]:
+                errors.append(f"{query_table_file} line {line_num}: range {start}-{end} out of bounds for sequence "
+                              f"{seq_id} (length {lengths[seq_id]})")
+            query_data[seq_id] = (start, end)
+    return query_data
+
+def scan_steering_vector(steering_file, errors):
+    """Counts the values of a steering vector file (first column), checking that all are numbers."""
+    count = 0
+    with open(steering_file, 'r') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            value = line.split('\t')[0]
+            try:
+                float(value)
+            except ValueError:
+                errors.append(f"{steering_file} line {line_num}: invalid number {value}")
+            count += 1
+    if count == 0:
+        errors.append(f"{steering_file}: no values found in steering vector file")
+    return count
+
+def check_layer(layer_name, model_name, model_config, errors):
+    index = layer_block_index(layer_name)
+    if index is not None and model_config is not None and index >= model_config['num_layers']:
+        errors.append(f"layer {layer_name} does not exist in {model_name} ({model_config['num_layers']} blocks)")
+
+def estimate_output_bytes(query_lengths, output_type, precision, n_strands, n_layers, n_scales, model_config):
+    """Estimated size of saved arrays (before compression) and tables."""
+    query_tokens = sum(query_lengths)
+    value_bytes = PRECISION_BYTES[precision]
+    per_token = 0
+    if output_type in ('logits', 'logits_and_embedding') and model_config:
+        per_token += model_config['vocab_size'] * value_bytes * n_strands
+    if output_type in ('logits_and_embedding', 'embedding') and model_config:
+        per_token += model_config['hidden_size'] * value_bytes * n_strands * n_layers
+    if output_type == 'mutation_effects':
+        # float32 array row and a table line
+        per_token += 4 * 4 + 50
+    return query_tokens * per_token * n_scales
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size < 1024 or unit == 'TB':
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+def run_preflight(args, steering_scales, log=print):
+    """
+    Validates the inputs of a run_evo.py run without loading torch or the model, and reports
+    the amount of work and the expected output size. Raises ValueError listing all problems found.
+    """
+    start_time = time.time()
+    errors = []
+
+    model_names = [model_name for model_name, _ in parse_model_routes(args.model_routes)] if args.model_routes else [args.model_name]
+    model_configs = {model_name: read_model_config(model_name, args.configs_dir) for model_name in model_names}
+
+    records = scan_fasta(args.fasta_file, errors)
+    if not records:
+        errors.append(f"no sequences found in {args.fasta_file}")
+    lengths = dict(records)
+
+    query_data = {}
+    if args.query_table:
+        query_data = scan_query_table(args.query_table, lengths, errors)
+
+    if args.steering_layer:
+        for model_name, model_config in model_configs.items():
+            check_layer(args.steering_layer, model_name, model_config, errors)
+        if not args.steering_vector_file:
+            errors.append("--steering_vector_file is required when --steering_layer is specified.")
+        else:
+            vector_length = scan_steering_vector(args.steering_vector_file, errors)
+            for model_name, model_config in model_configs.items():
+                if model_config and vector_length and vector_length != model_config['hidden_size']:
+                    errors.append(f"steering vector has {vector_length} values, {model_name} has hidden size "
+                                  f"{model_config['hidden_size']}")
+    for layer_name in args.embedding_layers or []:
+        for model_name, model_config in model_configs.items():
+            check_layer(layer_name, model_name, model_config, errors)
+
+    if errors:
+        shown = errors[:MAX_REPORTED_ERRORS]
+        if len(errors) > len(shown):
+            shown.append(f"... and {len(errors) - len(shown)} more")
+        raise ValueError(f"preflight found {len(errors)} problems:\n  " + "\n  ".join(shown))
+
+    # work and output size estimates
+    n_strands = 2 if args.strand_mode == 'both' else 1
+    n_scales = 1 + len(steering_scales) if args.steering_layer else 1
+    n_layers = len(args.embedding_layers or [])
+    total_length = sum(lengths.values())
+    query_lengths = [end - start + 1 for start, end in
+                     (query_data.get(seq_id, (1, length)) for seq_id, length in records)]
+    log(f"preflight: {len(records)} sequences, {total_length} bases (longest {max(lengths.values())})")
+    if args.mode == 'generate':
+        log(f"preflight: {len(records) * args.n_samples * args.n_tokens * n_scales} tokens to generate")
+    else:
+        log(f"preflight: {total_length * n_strands * n_scales} tokens in forward passes "
+            f"({n_strands} strands x {n_scales} scales)")
+        model_config = next((config for config in model_configs.values() if config), None)
+        output_bytes = estimate_output_bytes(query_lengths, args.output_type, args.output_precision,
+                                             n_strands, n_layers, n_scales, model_config)
+        log(f"preflight: estimated output size {format_bytes(output_bytes)} before compression")
+    log(f"preflight: inputs are valid ({time.time() - start_time:.2f} seconds)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate the inputs of a run_evo.py run, without loading the model.")
+    parser.add_argument('--fasta_file', type=str, required=True, help="Path to the input FASTA file.")
+    parser.add_argument('--model_name', type=str, default='evo2_7b', help="Name of the Evo2 model.")
+    parser.add_argument('--model_routes', type=str, default=None, help="Models routed by length (see run_evo.py).")
+    parser.add_argument('--query_table', type=str, default=None, help="Optional query table.")
+    parser.add_argument('--steering_layer', type=str, default=None, help="Layer name of the steering vector.")
+    parser.add_argument('--steering_vector_file', type=str, default=None, help="Steering vector file.")
+    parser.add_argument('--embedding_layers', nargs='+', default=None, help="Embedding layer names.")
+    parser.add_argument('--configs_dir', type=str, default=DEFAULT_CONFIGS_DIR, help="Model architecture configs.")
+    args = parser.parse_args()
+
+    # defaults for the work and output size estimates
+    args.mode, args.output_type, args.output_precision, args.strand_mode = 'score', 'summary_only', 'float32', 'plus'
+    try:
+        run_preflight(args, steering_scales=[1.0])
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,33 @@
 import argparse
-import torch
+import functools
 import sys
-
-num_devices = torch.cuda.device_count()
-print(f"Found {num_devices} CUDA devices:")
-for i in range(num_devices):
-    print(f"  Device {i}: {torch.cuda.get_device_name(i)}")
-
 import os
 import numpy as np # Add numpy import here
 import json
-import torch.nn.functional as F
 
-from evo2 import Evo2
+from output_codec import PRECISIONS, COMPRESSIONS, encode_tensor, save_array
+from scheduler import (DEFAULT_CONFIGS_DIR, AdaptiveRunner, read_model_config, device_memory_budget,
+                       schedule_order, free_memory, parse_model_routes, assign_routes)
+from generation import generate_to_fasta
+from activation_cache import ActivationCache, ActivationSnapshot, runs_after_block
+from preflight import run_preflight
+from output_index import OutputIndex, ChecksumFile
+from run_log import setup_run_log, checkpoint, detail, Progress
+
+# torch and evo2 are imported after the inputs are validated, see import_model_libraries
+torch = None
+Evo2 = None
+
+def import_model_libraries():
+    """Imports torch and evo2, which take several seconds and initialize CUDA."""
+    global torch, Evo2
+    import torch
+    from evo2 import Evo2
+
+    num_devices = torch.cuda.device_count()
+    print(f"Found {num_devices} CUDA devices:")
+    for i in range(num_devices):
+        print(f"  Device {i}: {torch.cuda.get_device_name(i)}")
 
 def read_fasta(fasta_file):
     """Reads a FASTA file and returns a dictionary of sequences."""
@@ -28,6 +43,13 @@ def read_fasta(fasta_file):
                 sequences[current_seq_id] += line
     return sequences
 
+# byte lookup table for complementing nucleotides, other characters are kept as-is
+COMPLEMENT_TABLE = bytes.maketrans(b"ACGTRYKMBDHVNacgtrykmbdhvn", b"TGCAYRMKVHDBNtgcayrmkvhdbn")
+
+def reverse_complement(sequence):
+    """Returns the reverse complement of a nucleotide sequence."""
+    return sequence.encode('ascii').translate(COMPLEMENT_TABLE)[::-1].decode('ascii')
+
 def read_query_table(query_table_file):
     """Reads query table with seq_id, start, end columns (1-indexed, inclusive)."""
     print(f"reading query table from {query_table_file}")
@@ -59,7 +81,7 @@ def read_query_table(query_table_file):
                 raise ValueError(f"line {line_num}: invalid coordinates start={start}, end={end}")
             
             query_data[seq_id] = (start, end)
-            print(f"  {seq_id}: positions {start}-{end}")
+            detail(f"  {seq_id}: positions {start}-{end}")
     
     print(f"loaded {len(query_data)} entries from query table")
     return query_data
@@ -88,10 +110,172 @@ def read_steering_vector_table(steering_file):
     print(f"loaded steering vector with {len(values)} values")
     return np.array(values)
 
+def create_steering_hook(steering_vector):
+    def hook_fn(module, input, output):
+        if isinstance(output, tuple):
+            return (output[0] + steering_vector,) + output[1:]
+        else:
+            return output + steering_vector
+    return hook_fn
+
+def register_steering(evo_model, steering_layer, base_steering_vector, scale):
+    """Registers the scaled steering vector on a layer, returns the hook handle (None for scale 0)."""
+    if not steering_layer or scale == 0.0:
+        return None
+    layer = evo_model.model.get_submodule(steering_layer)
+    scaled_steering_vector = base_steering_vector * scale
+    handle = layer.register_forward_hook(create_steering_hook(scaled_steering_vector))
+    print(f"  steering hook registered on: {steering_layer} with scale {scale}")
+    return handle
+
+def run_generation(args, seq_ids, prompts, scales_to_process, base_steering_vector):
+    """Samples continuations of the input sequences, writing one FASTA file per steering scale."""
+    if args.seed is not None:
+        torch.manual_seed(args.seed)
+
+    print(f"loading Evo2 model: {args.model_name}")
+    evo_model = Evo2(model_name=args.model_name, local_path=args.checkpoint_path)
+    print("model loaded.")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_basename = os.path.splitext(os.path.basename(args.fasta_file))[0]
+    output_index = OutputIndex(args.output_dir)
+    print(f"generating {args.n_samples} samples of {args.n_tokens} tokens for {len(prompts)} prompts "
+          f"(temperature {args.temperature}, top_k {args.top_k}, batch size {args.generation_batch_size})")
+
+    for scale in scales_to_process:
+        scale_name = "unsteered" if scale == 0.0 else f"scale_{scale}"
+        print(f"\ngenerating with steering scale: {scale_name}")
+        try:
+            steering_handle = register_steering(evo_model, args.steering_layer, base_steering_vector, scale)
+        except Exception as e:
+            print(f"  error registering steering hook: {e}")
+            continue
+
+        output_path = os.path.join(args.output_dir, f"{output_basename}_generated_{scale_name}.fasta")
+        with ChecksumFile(output_path) as f:
+            count = generate_to_fasta(evo_model, seq_ids, prompts, f,
+                                      n_samples=args.n_samples, n_tokens=args.n_tokens,
+                                      temperature=args.temperature, top_k=args.top_k,
+                                      batch_size=args.generation_batch_size)
+        print(f"  {count} generated sequences saved to {output_path}")
+        checkpoint()
+        output_index.add(f, 'generated', scale=scale_name)
+
+        if steering_handle is not None:
+            steering_handle.remove()
+
+    output_index.write()
+    print("\ngeneration complete for all scales.")
+
+def forward(evo_model, snapshot, layer_names, input_ids):
+    """
+    Runs the model on a [S, L] batch of token ids, resuming from the activation snapshot if one is given.
+    Returns the logits and a dict of the embeddings of layer_names (None for no embeddings).
+    """
+    if snapshot is not None:
+        logits, embeddings = snapshot.forward(input_ids, layer_names)
+    else:
+        logits, embeddings = evo_model.forward(
+            input_ids,
+            return_embeddings=layer_names is not None,
+            layer_names=layer_names
+        )
+        logits = logits[0]
+    # embeddings always with a batch dimension: [S, L, D]
+    embeddings = {name: emb if emb.dim() == 3 else emb.unsqueeze(0) for name, emb in (embeddings or {}).items()}
+    return logits, embeddings
+
+# substitutions of the mutation effect matrix, in column order
+MUTATION_BASES = 'ACGT'
+
+def mutation_effects(logits, token_ids, base_token_ids, lower_token_ids, start, end):
+    """
+    Returns the [end - start, 4] matrix of log p(alt) - log p(ref) for substituting each position in [start, end)
+    (0-indexed) with A, C, G and T, from the next-token logits at the previous position.
+    The log-softmax normalization cancels in the difference, so logit differences are used directly.
+    Soft-masked (lowercase acgt, token ids lower_token_ids) reference bases are scored as their uppercase base,
+    so that ref and alt logits are compared over the same tokens.
+    The first sequence position (no prediction) and non-ACGT reference bases are NaN.
+    """
+    pred_start = max(start, 1)
+    pred_logits = logits[pred_start - 1:end - 1].to(torch.float32)  # shape: [n, V], predicting positions pred_start..end-1
+    ref_ids = token_ids[pred_start:end].long()
+    # map lowercase base token ids to the uppercase ones
+    is_lower = ref_ids.unsqueeze(-1) == lower_token_ids  # shape: [n, 4]
+    ref_ids = torch.where(is_lower.any(dim=1), (is_lower.long() * base_token_ids).sum(dim=1), ref_ids)
+    ref_logits = pred_logits.gather(dim=1, index=ref_ids.unsqueeze(-1))  # shape: [n, 1]
+    effects = pred_logits[:, base_token_ids] - ref_logits  # shape: [n, 4]
+    effects[~torch.isin(ref_ids, base_token_ids)] = float('nan')
+    if pred_start > start:
+        effects = torch.cat([torch.full((1, len(MUTATION_BASES)), float('nan'), device=effects.device), effects], dim=0)
+    return effects.cpu().numpy()
+
+def process_sequence(evo_model, runner, sequence, query_range, both_strands,
+                     include_logits, include_embeddings, output_precision, include_effects=False):
+    """
+    Runs the model on a sequence (and its reverse complement in both-strands mode).
+    Returns the total log-likelihood of each strand, and the encoded logits and embeddings
+    restricted to the query range. With include_effects, also the plus strand mutation effect matrix
+    of the query range.
+    """
+    # in both-strands mode the reverse complement is batched together with the sequence
+    strands = [sequence, reverse_complement(sequence)] if both_strands else [sequence]
+
+    # Tokenize the sequence (and its reverse complement)
+    # The evo2_model.tokenizer.tokenize method returns a list of token IDs.
+    token_ids = [evo_model.tokenizer.tokenize(strand) for strand in strands]
+    # Convert to 2D tensor [S, sequence_length] (S strands), set dtype to torch.int, and move to the model's device
+    input_ids = torch.tensor(token_ids, dtype=torch.int).to('cuda:0')
+
+    seq_logits, embeddings = runner.run(input_ids)
+
+    # calculate total log-likelihood of each strand for the summary (next-token prediction)
+    # always computed in float32, independent of the output precision, in chunks that fit in memory
+    log_likelihoods = runner.log_likelihoods(seq_logits, input_ids)
+    output = {'log_likelihoods': log_likelihoods, 'logits': None, 'embeddings': {}, 'effects': None}
+
+    # subset logits and embeddings to query range (convert to 0-indexed)
+    start, end = query_range
+    query_start_idx = start - 1
+    query_end_idx = end  # end is inclusive in 1-indexed, so this works for slicing
+
+    # the minus strand range covers the same bases in reverse complement coordinates
+    strand_ranges = [(query_start_idx, query_end_idx)]
+    if both_strands:
+        strand_ranges.append((len(sequence) - query_end_idx, len(sequence) - query_start_idx))
+
+    if include_effects:
+        base_token_ids = torch.tensor(evo_model.tokenizer.tokenize(MUTATION_BASES), dtype=torch.long, device=input_ids.device)
+        lower_token_ids = torch.tensor(evo_model.tokenizer.tokenize(MUTATION_BASES.lower()), dtype=torch.long, device=input_ids.device)
+        output['effects'] = mutation_effects(seq_logits[0], input_ids[0], base_token_ids, lower_token_ids,
+                                             query_start_idx, query_end_idx)
+
+    if include_logits:
+        strand_logits = torch.cat([seq_logits[k:k + 1, a:b, :] for k, (a, b) in enumerate(strand_ranges)], dim=0)
+        # encode logits on device in the requested precision, then move to NumPy
+        output['logits'] = encode_tensor(strand_logits, output_precision)
+
+    if include_embeddings:
+        for layer_name, emb_tensor in embeddings.items():
+            if both_strands:
+                # keep the strand dimension: [2, query_length, D]
+                emb_view = torch.stack([emb_tensor[k, a:b, :] for k, (a, b) in enumerate(strand_ranges)], dim=0)
+            else:
+                # remove batch dimension
+                emb_view = emb_tensor[0, query_start_idx:query_end_idx, :]
+            # encode embeddings on device in the requested precision, then move to NumPy
+            output['embeddings'][layer_name] = encode_tensor(emb_view, output_precision)
+
+    return output
+
 def main():
     parser = argparse.ArgumentParser(description="Run Evo2 model on sequences.")
     parser.add_argument('--fasta_file', type=str, required=True,
-                        help="Path to the input FASTA file.")
+                        help="Path to the input FASTA file (prompts in generate mode).")
+    parser.add_argument('--mode', type=str, choices=['score', 'generate'], default='score',
+                        help="'score' evaluates the input sequences, 'generate' samples continuations of them "
+                             "and saves <basename>_generated_<scale>.fasta. Defaults to 'score'.")
     parser.add_argument('--model_name', type=str, default='evo2_7b',
                         help=f"Name of the Evo2 model to use. Defaults to 'evo2_7b'. ")
     parser.add_argument('--checkpoint_path', type=str, default=None,
@@ -99,11 +283,12 @@ def main():
                              "the script will attempt to download from HuggingFace.")
     parser.add_argument('--output_dir', type=str, default='.',
                         help="Directory to save the output. Defaults to current directory.")
-    parser.add_argument('--output_type', type=str, choices=['logits', 'logits_and_embedding', 'embedding', 'summary_only'], 
+    parser.add_argument('--output_type', type=str, choices=['logits', 'logits_and_embedding', 'embedding', 'summary_only', 'mutation_effects'], 
                         default='logits',
                         help="Type of output to generate: 'logits' (logits only), "
                              "'logits_and_embedding' (both logits and embeddings), "
-                             "'embedding' (embeddings only), or 'summary_only' (summary table only). "
+                             "'embedding' (embeddings only), 'summary_only' (summary table only), or 'mutation_effects' "
+                             "(log p(alt) - log p(ref) of every single-base substitution in the query range). "
                              "Summary table is always included.")
     parser.add_argument('--embedding_layers', nargs='+', default=None,
                         help="List of layer names for embedding extraction. "
@@ -118,9 +303,71 @@ def main():
                         help="Path to tab-delimited file containing steering vector (first column values).")
     parser.add_argument('--steering_scale', type=str, default="1.0",
                         help="Scale factor(s) for steering vector. Single value or comma-separated values. Defaults to '1.0'.")
+    parser.add_argument('--strand_mode', type=str, choices=['plus', 'both'], default='plus',
+                        help="Strands to evaluate: 'plus' (sequences as given) or 'both' (each sequence and its reverse "
+                             "complement in a single batch). In 'both' mode a paired strand table is saved and logits and "
+                             "embeddings have a leading strand axis (plus, minus). Defaults to 'plus'.")
+    parser.add_argument('--model_routes', type=str, default=None,
+                        help="Route sequences to models by length, e.g. 'evo2_7b_base:8192,evo2_7b'. Each model "
+                             "processes the sequences up to its maximal length not taken by an earlier model, "
+                             "the last model has no limit. Models run as sequential phases and outputs are merged. "
+                             "Overrides --model_name.")
+    parser.add_argument('--checkpoint_dir', type=str, default=None,
+                        help="Directory with <model>/<model>.pt checkpoints, used with --model_routes.")
+    parser.add_argument('--memory_budget_gb', type=float, default=None,
+                        help="GPU memory available for activations, in GB. Defaults to 90%% of the free memory of all devices "
+                             "after loading the model. Batches and sequences that do not fit are split or processed "
+                             "in windows.")
+    parser.add_argument('--configs_dir', type=str, default=DEFAULT_CONFIGS_DIR,
+                        help="Directory with the model architecture configs, used to estimate memory usage.")
+    parser.add_argument('--output_precision', type=str, choices=PRECISIONS, default='float32',
+                        help="Precision of saved logits and embeddings: 'float32' (.npy), 'bfloat16' (stored as uint16), "
+                             "'float16' or 'int8' (with per-row scales). Non-float32 arrays are saved as .npz files, "
+                             "use scripts/output_codec.py to decode them. Defaults to 'float32'.")
+    parser.add_argument('--output_compression', type=str, choices=COMPRESSIONS, default='none',
+                        help="Block compression for saved arrays: 'none', 'zstd' or 'lz4'. Defaults to 'none'.")
+    parser.add_argument('--n_tokens', type=int, default=500,
+                        help="Generate mode: number of tokens to generate per sample. Defaults to 500.")
+    parser.add_argument('--n_samples', type=int, default=1,
+                        help="Generate mode: number of samples per prompt. Defaults to 1.")
+    parser.add_argument('--temperature', type=float, default=1.0,
+                        help="Generate mode: sampling temperature. Defaults to 1.0.")
+    parser.add_argument('--top_k', type=int, default=4,
+                        help="Generate mode: sample from the top k tokens. Defaults to 4.")
+    parser.add_argument('--generation_batch_size', type=int, default=8,
+                        help="Generate mode: number of prompts x samples generated together. Prompts of different "
+                             "lengths are generated in separate batches. Defaults to 8.")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Generate mode: random seed for sampling (SEED). Unseeded runs sample differently each time.")
+    parser.add_argument('--snapshot_block', type=int, default=None,
+                        help="Save the output of blocks.N for each input to --snapshot_dir, and resume later runs "
+                             "of the same input (e.g. further steering scales) from it, running only blocks N+1 onward. "
+                             "The steering layer and embedding layers must come after block N.")
+    parser.add_argument('--snapshot_dir', type=str, default=None,
+                        help="Local directory of the activation snapshot cache, required with --snapshot_block.")
+    parser.add_argument('--snapshot_sync_dir', type=str, default=None,
+                        help="Directory the snapshots are copied to and fetched from, e.g. on the bucket mount, "
+                             "so that they are shared by jobs.")
+    parser.add_argument('--preflight_only', action='store_true',
+                        help="Only validate the inputs and report the estimated work and output size, "
+                             "without importing torch or loading the model.")
+    parser.add_argument('--log_file', type=str, default=None,
+                        help="Local file for the run log. Per-sequence and per-file messages are appended to it (and not "
+                             "printed), stdout and stderr are expected to be appended by the caller (tee -a in run_evo.sh).")
+    parser.add_argument('--log_copy', type=str, default=None,
+                        help="Path the log file is copied to at checkpoints (after each scale and when outputs are saved), "
+                             "at exit and on SIGTERM, e.g. in the output directory on the bucket mount.")
+    parser.add_argument('--log_flush_interval', type=float, default=10.0,
+                        help="Seconds between flushes of the per-sequence messages to the log file. Defaults to 10.")
+    parser.add_argument('--progress_interval', type=float, default=30.0,
+                        help="Seconds between progress reports (sequences, tokens/sec, ETA). Defaults to 30.")
 
     args = parser.parse_args()
 
+    if args.log_file:
+        setup_run_log(args.log_file, args.log_copy, args.log_flush_interval)
+    print(f"running: python3 {' '.join(sys.argv)}")
+
     if args.output_type in ['logits_and_embedding', 'embedding'] and not args.embedding_layers:
         parser.error("--embedding_layers is required when output_type includes embeddings.")
 
@@ -135,6 +382,20 @@ def main():
                 embedding_layers.append(layer)
         args.embedding_layers = embedding_layers
 
+    # generation runs one model on all prompts, routing is resolved when the job is built
+    if args.mode == 'generate' and args.model_routes:
+        parser.error("--model_routes is not supported with --mode generate.")
+
+    # layers hooked during a run must come after the snapshot block, since resumed runs skip earlier blocks
+    if args.snapshot_block is not None:
+        if not args.snapshot_dir:
+            parser.error("--snapshot_dir is required when --snapshot_block is specified.")
+        if args.steering_layer and not runs_after_block(args.steering_layer, args.snapshot_block):
+            parser.error(f"steering layer {args.steering_layer} must come after the snapshot block blocks.{args.snapshot_block}.")
+        for layer_name in args.embedding_layers or []:
+            if not runs_after_block(layer_name, args.snapshot_block):
+                parser.error(f"embedding layer {layer_name} must come after the snapshot block blocks.{args.snapshot_block}.")
+
     # handle comma-separated steering scales (support 'n' prefix for negatives, e.g., n0.5 -> -0.5)
     steering_scales = []
     if args.steering_scale:
@@ -160,27 +421,22 @@ def main():
     if not steering_scales:
         steering_scales = [1.0]
 
+    # validate all inputs before the slow torch and model loading
+    try:
+        run_preflight(args, steering_scales)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    if args.preflight_only:
+        return
+
+    import_model_libraries()
+
     # read query table if provided
     query_data = None
     if args.query_table:
         query_data = read_query_table(args.query_table)
 
-    print(f"loading Evo2 model: {args.model_name}")
-    evo_model = Evo2(model_name=args.model_name, local_path=args.checkpoint_path)
-    print("model loaded.")
-
-    # load steering vector if specified
-    base_steering_vector = None
-    if args.steering_layer:
-        if not args.steering_vector_file:
-            parser.error("--steering_vector_file is required when --steering_layer is specified.")
-        steering_vector_np = read_steering_vector_table(args.steering_vector_file)
-        base_steering_vector = torch.from_numpy(steering_vector_np).to(torch.bfloat16).to('cuda:0')
-        if len(base_steering_vector.shape) == 1:
-            base_steering_vector = base_steering_vector.unsqueeze(0).unsqueeze(0)
-        print(f"loaded base steering vector: shape {base_steering_vector.shape}")
-        print(f"will process with scales: {steering_scales}")
-
     print(f"reading sequences from {args.fasta_file}")
     sequences_dict = read_fasta(args.fasta_file)
     if not sequences_dict:
@@ -202,19 +458,40 @@ def main():
         if seq_id not in sequences_dict:
             raise ValueError(f"query table references missing sequence: {seq_id}")
 
+    # verify query ranges are valid
+    for seq_id, (start, end) in query_data.items():
+        sequence = sequences_dict[seq_id]
+        if start < 1 or end > len(sequence) or start > end:
+            raise ValueError(f"query range {start}-{end} out of bounds for sequence {seq_id} (length {len(sequence)})")
+
+    # load steering vector if specified
+    base_steering_vector = None
+    if args.steering_layer:
+        if not args.steering_vector_file:
+            parser.error("--steering_vector_file is required when --steering_layer is specified.")
+        steering_vector_np = read_steering_vector_table(args.steering_vector_file)
+        base_steering_vector = torch.from_numpy(steering_vector_np).to(torch.bfloat16).to('cuda:0')
+        if len(base_steering_vector.shape) == 1:
+            base_steering_vector = base_steering_vector.unsqueeze(0).unsqueeze(0)
+        print(f"loaded base steering vector: shape {base_steering_vector.shape}")
+        print(f"will process with scales: {steering_scales}")
+
     print(f"processing {len(seqs_to_process)} sequences...")
+    both_strands = args.strand_mode == 'both'
+    if both_strands:
+        print("evaluating both strands of each sequence")
 
     # determine what outputs are needed
     include_logits = args.output_type in ['logits', 'logits_and_embedding']
     include_embeddings = args.output_type in ['logits_and_embedding', 'embedding']
+    include_effects = args.output_type == 'mutation_effects'
 
-    def create_steering_hook(steering_vector):
-        def hook_fn(module, input, output):
-            if isinstance(output, tuple):
-                return (output[0] + steering_vector,) + output[1:]
-            else:
-                return output + steering_vector
-        return hook_fn
+    # route sequences to models by length, each model is one processing phase
+    if args.model_routes:
+        routes = parse_model_routes(args.model_routes)
+        phases = assign_routes([len(sequence) for sequence in seqs_to_process], routes)
+    else:
+        phases = [(args.model_name, None, list(range(len(seqs_to_process))))]
 
     # determine scales to process (include 0 for unsteered if steering is provided)
     scales_to_process = [0.0] if args.steering_layer else []
@@ -223,114 +500,131 @@ def main():
     else:
         scales_to_process = [0.0]  # unsteered only
 
-    # store results for each scale
-    results_by_scale = {}
+    if args.mode == 'generate':
+        run_generation(args, seq_ids, seqs_to_process, scales_to_process, base_steering_vector)
+        return
 
+    # store results for each scale, in input order
+    num_seqs = len(seqs_to_process)
+    results_by_scale = {}
     for scale in scales_to_process:
-        scale_name = "unsteered" if scale == 0.0 else f"scale_{scale}"
-        print(f"\nprocessing with steering scale: {scale_name}")
-        
-        # setup steering for this scale
-        steering_handle = None
-        if args.steering_layer and scale != 0.0:
+        results_by_scale[scale] = {
+            'logits': [None] * num_seqs if include_logits else None,
+            'embeddings': {} if include_embeddings else None, # Dict to store embeddings layer_name -> list_of_arrays
+            'summary': [None] * num_seqs, # List of (seq_id, start, end, total_log_likelihood)
+            'strands': [None] * num_seqs if both_strands else None, # List of (seq_id, start, end, plus, minus)
+            'effects': [None] * num_seqs if include_effects else None, # List of [query_length, 4] arrays
+            'scale_name': "unsteered" if scale == 0.0 else f"scale_{scale}"
+        }
+
+    for model_name, max_length, phase_indices in phases:
+        if not phase_indices:
+            continue
+        if args.model_routes:
+            limit = f"up to length {max_length}" if max_length else "longer sequences"
+            print(f"\nphase {model_name}: {len(phase_indices)} sequences ({limit})")
+            checkpoint_path = os.path.join(args.checkpoint_dir, model_name, f"{model_name}.pt") if args.checkpoint_dir else None
+        else:
+            checkpoint_path = args.checkpoint_path
+
+        print(f"loading Evo2 model: {model_name}")
+        evo_model = Evo2(model_name=model_name, local_path=checkpoint_path)
+        print("model loaded.")
+
+        # memory-aware forward passes, sequences are processed longest first
+        # resume from activation snapshots of blocks.N when available
+        snapshot = None
+        if args.snapshot_block is not None:
+            snapshot_name = f"{model_name}_blocks.{args.snapshot_block}"
+            snapshot_cache = ActivationCache(os.path.join(args.snapshot_dir, snapshot_name),
+                                             os.path.join(args.snapshot_sync_dir, snapshot_name) if args.snapshot_sync_dir else None)
+            snapshot = ActivationSnapshot(evo_model.model, args.snapshot_block, snapshot_cache)
+            print(f"activation snapshots of blocks.{args.snapshot_block} in {snapshot_cache.cache_dir}")
+
+        model_config = read_model_config(model_name, args.configs_dir)
+        if args.memory_budget_gb is not None:
+            memory_budget = int(args.memory_budget_gb * 1024 ** 3)
+        else:
+            memory_budget = device_memory_budget()
+        if model_config is None:
+            print(f"no architecture config found for {model_name}, memory estimates disabled")
+        elif memory_budget is not None:
+            print(f"memory budget for activations: {memory_budget / 1024 ** 3:.1f} GB")
+        # the model and snapshot are bound explicitly, so that deleting them below releases the phase's model
+        layer_names = args.embedding_layers if include_embeddings else None
+        runner = AdaptiveRunner(functools.partial(forward, evo_model, snapshot, layer_names), model_config, memory_budget)
+        processing_order = [phase_indices[k] for k in schedule_order([len(seqs_to_process[i]) for i in phase_indices])]
+
+        for scale in scales_to_process:
+            results = results_by_scale[scale]
+            print(f"\nprocessing with steering scale: {results['scale_name']}")
+
+            # setup steering for this scale
             try:
-                layer = evo_model.model.get_submodule(args.steering_layer)
-                scaled_steering_vector = base_steering_vector * scale
-                steering_handle = layer.register_forward_hook(create_steering_hook(scaled_steering_vector))
-                print(f"  steering hook registered on: {args.steering_layer} with scale {scale}")
+                steering_handle = register_steering(evo_model, args.steering_layer, base_steering_vector, scale)
             except Exception as e:
                 print(f"  error registering steering hook: {e}")
+                results['failed'] = True
                 continue
 
-        # store results for this scale
-        all_logits = []
-        all_embeddings = {} # Dict to store embeddings layer_name -> list_of_tensors
-        summary_data = [] # List of (seq_id, start, end, total_log_likelihood)
-
-        for i in range(len(seqs_to_process)):
-            seq_id = seq_ids[i]
-            sequence = seqs_to_process[i]
-            print(f"    processing sequence: {seq_id} (length: {len(sequence)})")
-
-            # verify query range is valid
-            if seq_id in query_data:
-                start, end = query_data[seq_id]
-                if start < 1 or end > len(sequence) or start > end:
-                    raise ValueError(f"query range {start}-{end} out of bounds for sequence {seq_id} (length {len(sequence)})")
-
-            # Tokenize the single sequence
-            # The evo2_model.tokenizer.tokenize method returns a list of token IDs.
-            # For individual processing or to match `forward`'s expected input, we tokenize one by one.
-            token_ids = evo_model.tokenizer.tokenize(sequence) # Tokenize the sequence into a list of token IDs
-            # Convert to 2D tensor [1, sequence_length], set dtype to torch.int, and move to the model's device
-            input_ids = torch.tensor(token_ids, dtype=torch.int).unsqueeze(0).to('cuda:0')
-
-            logits, embeddings = evo_model.forward(
-                input_ids,
-                return_embeddings=include_embeddings,
-                layer_names=args.embedding_layers if include_embeddings else None
-            )
-
-            # calculate total log-likelihood for summary (next-token prediction)
-            target_ids = input_ids[:, 1:].long()  # shape: [1, L-1], convert to int64 for gather()
-            pred_logits = logits[0][:, :-1, :]     # shape: [1, L-1, V] to match targets
-            
-            # compute log-probs using log-softmax
-            log_probs = F.log_softmax(pred_logits, dim=-1)
-            
-            # gather log-likelihoods for the true next tokens
-            log_likelihoods = log_probs.gather(dim=2, index=target_ids.unsqueeze(-1)).squeeze(-1)  # shape: [1, L-1]
-            
-            # sum for total log-likelihood
-            total_log_likelihood = log_likelihoods.to(torch.float32).sum().item()
-
-            # get query range for this sequence
-            start, end = query_data.get(seq_id, (1, len(sequence)))
-            summary_data.append((seq_id, start, end, total_log_likelihood))
-
-            # subset logits and embeddings to query range (convert to 0-indexed)
-            query_start_idx = start - 1
-            query_end_idx = end  # end is inclusive in 1-indexed, so this works for slicing
-
-            # save logits if requested
-            if include_logits:
-                # Detach logits from the graph, move to CPU, convert to float32, then to NumPy
-                query_logits = logits[0][:, query_start_idx:query_end_idx, :].detach().cpu().to(torch.float32).numpy()
-                all_logits.append(query_logits)
-
-            if include_embeddings and embeddings:
-                for layer_name, emb_tensor in embeddings.items():
-                    if layer_name not in all_embeddings:
-                        all_embeddings[layer_name] = []
-                    # remove batch dimension if present
-                    emb_view = emb_tensor[0] if emb_tensor.dim() == 3 else emb_tensor
-                    # Detach embeddings, move to CPU, convert to float32, then to NumPy
-                    query_embeddings = emb_view[query_start_idx:query_end_idx, :].detach().cpu().to(torch.float32).numpy()
-                    all_embeddings[layer_name].append(query_embeddings)
-                    print(f"      embeddings from {layer_name} shape: {query_embeddings.shape} (query range {start}-{end})")
-
-        # store results for this scale
-        results_by_scale[scale] = {
-            'logits': all_logits if include_logits else None,
-            'embeddings': all_embeddings if include_embeddings else None,
-            'summary': summary_data,
-            'scale_name': scale_name
-        }
+            n_strands = 2 if both_strands else 1
+            progress = Progress(len(processing_order), sum(len(seqs_to_process[i]) * n_strands for i in processing_order),
+                                args.progress_interval)
+            for i in processing_order:
+                seq_id = seq_ids[i]
+                sequence = seqs_to_process[i]
+                detail(f"    processing sequence: {seq_id} (length: {len(sequence)})")
+
+                start, end = query_data.get(seq_id, (1, len(sequence)))
+                output = process_sequence(evo_model, runner, sequence, (start, end), both_strands,
+                                          include_logits, include_embeddings, args.output_precision, include_effects)
+
+                strand_log_likelihoods = output['log_likelihoods']
+                results['summary'][i] = (seq_id, start, end, strand_log_likelihoods[0])
+                if both_strands:
+                    results['strands'][i] = (seq_id, start, end, strand_log_likelihoods[0], strand_log_likelihoods[1])
+                if include_logits:
+                    results['logits'][i] = output['logits']
+                if include_effects:
+                    results['effects'][i] = output['effects']
+                if include_embeddings:
+                    for layer_name, query_embeddings in output['embeddings'].items():
+                        if layer_name not in results['embeddings']:
+                            results['embeddings'][layer_name] = [None] * num_seqs
+                        results['embeddings'][layer_name][i] = query_embeddings
+                        detail(f"      embeddings from {layer_name} shape: {query_embeddings['data'].shape} (query range {start}-{end})")
+                progress.update(tokens=len(sequence) * n_strands)
+
+            # cleanup steering hook for this scale
+            if steering_handle is not None:
+                steering_handle.remove()
+            checkpoint()
+
+        if snapshot is not None:
+            print(f"activation snapshots: {snapshot.hits} reused, {snapshot.misses} saved")
+
+        # release the model before loading the next phase
+        del evo_model, runner, snapshot
+        free_memory()
+
+    # scales whose steering hook could not be registered are skipped
+    results_by_scale = {scale: results for scale, results in results_by_scale.items() if not results.get('failed')}
 
-        # cleanup steering hook for this scale
-        if steering_handle is not None:
-            steering_handle.remove()
-    
     # Create output directory if it doesn't exist
     os.makedirs(args.output_dir, exist_ok=True)
 
     # Save outputs for each scale
     output_basename = os.path.splitext(os.path.basename(args.fasta_file))[0]
 
+    # index of saved files, used to select files when downloading
+    output_index = OutputIndex(args.output_dir)
+
     # save processed ids once (same for all scales)
-    with open(os.path.join(args.output_dir, f"{output_basename}_processed_ids.txt"), 'w') as f:
+    processed_ids_path = os.path.join(args.output_dir, f"{output_basename}_processed_ids.txt")
+    with ChecksumFile(processed_ids_path) as f:
         for seq_id in seq_ids:
             f.write(f"{seq_id}\n")
+    output_index.add(f, 'processed_ids')
 
     for scale, results in results_by_scale.items():
         scale_name = results['scale_name']
@@ -342,20 +636,53 @@ def main():
 
         # save summary table for this scale
         summary_output_path = os.path.join(args.output_dir, f"{output_basename}_summary_{scale_name}.txt")
-        with open(summary_output_path, 'w') as f:
+        with ChecksumFile(summary_output_path) as f:
             f.write("seq_id\tstart\tend\ttotal_log_likelihood\n")
             for seq_id, start, end, total_log_lik in summary_data:
                 f.write(f"{seq_id}\t{start}\t{end}\t{total_log_lik:.6f}\n")
         print(f"  summary table saved to {summary_output_path}")
+        output_index.add(f, 'summary', scale=scale_name)
+
+        # save paired strand table for this scale
+        if results['strands']:
+            strands_output_path = os.path.join(args.output_dir, f"{output_basename}_strands_{scale_name}.txt")
+            with ChecksumFile(strands_output_path) as f:
+                f.write("seq_id\tstart\tend\tplus_log_likelihood\tminus_log_likelihood\tcombined_log_likelihood\n")
+                for seq_id, start, end, plus_log_lik, minus_log_lik in results['strands']:
+                    combined_log_lik = (plus_log_lik + minus_log_lik) / 2
+                    f.write(f"{seq_id}\t{start}\t{end}\t{plus_log_lik:.6f}\t{minus_log_lik:.6f}\t{combined_log_lik:.6f}\n")
+            print(f"  strand table saved to {strands_output_path}")
+            output_index.add(f, 'strands', scale=scale_name)
+
+        # save mutation effect matrices: one table for all sequences, and a binary [query_length, 4] array per sequence
+        if include_effects:
+            effects_output_path = os.path.join(args.output_dir, f"{output_basename}_mutation_effects_{scale_name}.txt")
+            with ChecksumFile(effects_output_path) as f:
+                f.write("seq_id\tposition\tref\t" + "\t".join(MUTATION_BASES) + "\n")
+                for idx, effects in enumerate(results['effects']):
+                    seq_id, start, end, _ = summary_data[idx]
+                    sequence = seqs_to_process[idx]
+                    for offset, row in enumerate(effects):
+                        position = start + offset
+                        values = "\t".join("NA" if np.isnan(value) else f"{value:.4f}" for value in row)
+                        f.write(f"{seq_id}\t{position}\t{sequence[position - 1]}\t{values}\n")
+            print(f"  mutation effects table saved to {effects_output_path}")
+            output_index.add(f, 'mutation_effects_table', scale=scale_name)
+            for idx, effects in enumerate(results['effects']):
+                seq_id_safe_filename = "".join(c if c.isalnum() else "_" for c in seq_ids[idx])
+                effects_output_base = os.path.join(args.output_dir, f"{output_basename}_{seq_id_safe_filename}_mutation_effects_{scale_name}")
+                effects_file = save_array(effects_output_base, {'data': effects}, 'float32', args.output_compression)
+                output_index.add(effects_file, 'mutation_effects', seq_id=seq_ids[idx], scale=scale_name)
 
         # save logits if requested
         if include_logits and all_logits:
             # Saving as individual npy files per sequence for easier R import if sequences are variable length
             for idx, logit_arr in enumerate(all_logits):
                 seq_id_safe_filename = "".join(c if c.isalnum() else "_" for c in seq_ids[idx]) # make filename safe
-                logit_output_path = os.path.join(args.output_dir, f"{output_basename}_{seq_id_safe_filename}_logits_{scale_name}.npy")
-                np.save(logit_output_path, logit_arr)
-                print(f"    logits for {seq_ids[idx]} saved to {logit_output_path}")
+                logit_output_base = os.path.join(args.output_dir, f"{output_basename}_{seq_id_safe_filename}_logits_{scale_name}")
+                logit_file = save_array(logit_output_base, logit_arr, args.output_precision, args.output_compression)
+                detail(f"    logits for {seq_ids[idx]} saved to {logit_file.path}")
+                output_index.add(logit_file, 'logits', seq_id=seq_ids[idx], scale=scale_name)
 
         if include_embeddings and all_embeddings:
             for layer_name, layer_embs_list in all_embeddings.items():
@@ -363,11 +690,14 @@ def main():
                 safe_layer_name = layer_name.replace('.', '_')
                 for idx, emb_arr in enumerate(layer_embs_list):
                     seq_id_safe_filename = "".join(c if c.isalnum() else "_" for c in seq_ids[idx])
-                    emb_output_path = os.path.join(args.output_dir, f"{output_basename}_{seq_id_safe_filename}_embeddings_{safe_layer_name}_{scale_name}.npy")
-                    np.save(emb_output_path, emb_arr)
-                    print(f"    embeddings from {layer_name} for {seq_ids[idx]} saved to {emb_output_path}")
+                    emb_output_base = os.path.join(args.output_dir, f"{output_basename}_{seq_id_safe_filename}_embeddings_{safe_layer_name}_{scale_name}")
+                    emb_file = save_array(emb_output_base, emb_arr, args.output_precision, args.output_compression)
+                    detail(f"    embeddings from {layer_name} for {seq_ids[idx]} saved to {emb_file.path}")
+                    output_index.add(emb_file, 'embeddings', seq_id=seq_ids[idx], layer=layer_name, scale=scale_name)
 
+    output_index.write()
     print("\nprocessing complete for all scales.")
+    checkpoint()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
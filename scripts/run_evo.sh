@@ -11,52 +11,138 @@ OUTPUT_DIR=$JOB_DIR/output
 CHECKPOINT_DIR=$MNT_DIR/models
 CHECKPOINT_PATH=$CHECKPOINT_DIR/$MODEL_NAME/$MODEL_NAME.pt
 
-FASTA_FILE=$JOB_DIR/input.fasta
-QUERY_TABLE=$JOB_DIR/query_table.csv
-STEERING_VECTOR_FILE_PATH=$JOB_DIR/steering_vector.tsv
-
-echo "Running job: $JOB"
-echo "Mount directory: $MNT_DIR"
-echo "Input fasta file: $FASTA_FILE"
-echo "Query table: $QUERY_TABLE"
-echo "Output directory: $OUTPUT_DIR"
-echo "Scripts directory: $SCRIPTS_DIR"
-echo "Model name: $MODEL_NAME"
-echo "Checkpoint path: $CHECKPOINT_PATH"
-echo "Output type: $OUTPUT_TYPE"
-echo "Embedding layers: $EMBEDDING_LAYERS"
-echo "Steering layer: $STEERING_LAYER"
-echo "Steering vector file: $STEERING_VECTOR_FILE_PATH"
-echo "Steering scales: $STEERING_SCALES"
-echo "CUDA_VISIBLE_DEVICES: $CUDA_VISIBLE_DEVICES"
-mkdir -p $OUTPUT_DIR
-
-# Construct arguments for run_evo.py
-SCRIPT_ARGS="--fasta_file $FASTA_FILE --model_name $MODEL_NAME --checkpoint_path $CHECKPOINT_PATH"
-SCRIPT_ARGS="$SCRIPT_ARGS --output_dir $OUTPUT_DIR"
-SCRIPT_ARGS="$SCRIPT_ARGS --output_type $OUTPUT_TYPE"
-
-if [ -f "$QUERY_TABLE" ]; then
-    SCRIPT_ARGS="$SCRIPT_ARGS --query_table $QUERY_TABLE"
-fi
-
-if [ "$OUTPUT_TYPE" = "logits_and_embedding" ] || [ "$OUTPUT_TYPE" = "embedding" ]; then
-    if [ -n "$EMBEDDING_LAYERS" ]; then
-        SCRIPT_ARGS="$SCRIPT_ARGS --embedding_layers $EMBEDDING_LAYERS"
-    fi
-fi
-
-if [ -n "$STEERING_LAYER" ] && [ -f "$STEERING_VECTOR_FILE_PATH" ]; then
-    SCRIPT_ARGS="$SCRIPT_ARGS --steering_layer $STEERING_LAYER"
-    SCRIPT_ARGS="$SCRIPT_ARGS --steering_vector_file $STEERING_VECTOR_FILE_PATH"
-    if [ -n "$STEERING_SCALES" ]; then
-        SCRIPT_ARGS="$SCRIPT_ARGS --steering_scale $STEERING_SCALES"
-    fi
-fi
-
-export PYTORCH_CUDA_ALLOC_CONF=expandable_segments:True
-
-{
-  echo "running: python3 $SCRIPTS_DIR/run_evo.py $SCRIPT_ARGS"
-  python3 "$SCRIPTS_DIR/run_evo.py" $SCRIPT_ARGS
-} 2>&1 | tee "$OUTPUT_DIR/run_evo.log"
+# activation snapshots are memory mapped on local disk, and shared by all jobs through the bucket
+# keyed by model, block and input
+SNAPSHOT_DIR=${TMPDIR:-/tmp}/snapshots
+SNAPSHOT_SYNC_DIR=$MNT_DIR/snapshots
+
+# inputs are either at content-addressed paths (set by evo_gcp) or in the job directory
+FASTA_FILE=$MNT_DIR/${INPUT_FASTA_PATH:-jobs/$JOB/input.fasta}
+QUERY_TABLE=$MNT_DIR/${QUERY_TABLE_PATH:-jobs/$JOB/query_table.csv}
+STEERING_VECTOR_FILE_PATH=$MNT_DIR/${STEERING_VECTOR_PATH:-jobs/$JOB/steering_vector.tsv}
+
+# the job log is written to local disk: the output of all commands through tee, and per-sequence messages
+# by run_evo.py, it is copied to the output directory by run_evo.py at checkpoints and here when the job ends
+LOCAL_LOG_DIR=${TMPDIR:-/tmp}/run_evo_$JOB
+LOCAL_LOG=$LOCAL_LOG_DIR/run_evo.log
+
+run_job() {
+    echo "Running job: $JOB"
+    echo "Mount directory: $MNT_DIR"
+    echo "Input fasta file: $FASTA_FILE"
+    echo "Query table: $QUERY_TABLE"
+    echo "Output directory: $OUTPUT_DIR"
+    echo "Scripts directory: $SCRIPTS_DIR"
+    echo "Model name: $MODEL_NAME"
+    echo "Checkpoint path: $CHECKPOINT_PATH"
+    echo "Model routes: $MODEL_ROUTES"
+    echo "Run mode: $RUN_MODE"
+    echo "Seed: $SEED"
+    echo "Output type: $OUTPUT_TYPE"
+    echo "Strand mode: $STRAND_MODE"
+    echo "Output precision: $OUTPUT_PRECISION"
+    echo "Output compression: $OUTPUT_COMPRESSION"
+    echo "Embedding layers: $EMBEDDING_LAYERS"
+    echo "Steering layer: $STEERING_LAYER"
+    echo "Steering vector file: $STEERING_VECTOR_FILE_PATH"
+    echo "Steering scales: $STEERING_SCALES"
+    echo "Snapshot block: $SNAPSHOT_BLOCK"
+    echo "Progress interval: $PROGRESS_INTERVAL"
+    echo "CUDA_VISIBLE_DEVICES: $CUDA_VISIBLE_DEVICES"
+    mkdir -p $OUTPUT_DIR
+
+    # Construct arguments for run_evo.py
+    SCRIPT_ARGS="--fasta_file $FASTA_FILE --model_name $MODEL_NAME --checkpoint_path $CHECKPOINT_PATH"
+    SCRIPT_ARGS="$SCRIPT_ARGS --output_dir $OUTPUT_DIR"
+    SCRIPT_ARGS="$SCRIPT_ARGS --output_type $OUTPUT_TYPE"
+
+    if [ -n "$MODEL_ROUTES" ]; then
+        SCRIPT_ARGS="$SCRIPT_ARGS --model_routes $MODEL_ROUTES --checkpoint_dir $CHECKPOINT_DIR"
+    fi
+
+    if [ "$RUN_MODE" = "generate" ]; then
+        SCRIPT_ARGS="$SCRIPT_ARGS --mode generate"
+        SCRIPT_ARGS="$SCRIPT_ARGS --n_tokens ${GENERATE_TOKENS:-500} --n_samples ${GENERATE_SAMPLES:-1}"
+        SCRIPT_ARGS="$SCRIPT_ARGS --temperature ${GENERATE_TEMPERATURE:-1.0} --top_k ${GENERATE_TOP_K:-4}"
+        SCRIPT_ARGS="$SCRIPT_ARGS --generation_batch_size ${GENERATE_BATCH_SIZE:-8}"
+        if [ -n "$SEED" ]; then
+            SCRIPT_ARGS="$SCRIPT_ARGS --seed $SEED"
+        fi
+    fi
+
+    if [ -n "$STRAND_MODE" ]; then
+        SCRIPT_ARGS="$SCRIPT_ARGS --strand_mode $STRAND_MODE"
+    fi
+
+    if [ -n "$OUTPUT_PRECISION" ]; then
+        SCRIPT_ARGS="$SCRIPT_ARGS --output_precision $OUTPUT_PRECISION"
+    fi
+
+    if [ -n "$OUTPUT_COMPRESSION" ]; then
+        SCRIPT_ARGS="$SCRIPT_ARGS --output_compression $OUTPUT_COMPRESSION"
+    fi
+
+    if [ -f "$QUERY_TABLE" ]; then
+        SCRIPT_ARGS="$SCRIPT_ARGS --query_table $QUERY_TABLE"
+    fi
+
+    if [ "$OUTPUT_TYPE" = "logits_and_embedding" ] || [ "$OUTPUT_TYPE" = "embedding" ]; then
+        if [ -n "$EMBEDDING_LAYERS" ]; then
+            SCRIPT_ARGS="$SCRIPT_ARGS --embedding_layers $EMBEDDING_LAYERS"
+        fi
+    fi
+
+    if [ -n "$STEERING_LAYER" ] && [ -f "$STEERING_VECTOR_FILE_PATH" ]; then
+        SCRIPT_ARGS="$SCRIPT_ARGS --steering_layer $STEERING_LAYER"
+        SCRIPT_ARGS="$SCRIPT_ARGS --steering_vector_file $STEERING_VECTOR_FILE_PATH"
+        if [ -n "$STEERING_SCALES" ]; then
+            SCRIPT_ARGS="$SCRIPT_ARGS --steering_scale $STEERING_SCALES"
+        fi
+    fi
+
+    if [ -n "$SNAPSHOT_BLOCK" ]; then
+        SCRIPT_ARGS="$SCRIPT_ARGS --snapshot_block $SNAPSHOT_BLOCK --snapshot_dir $SNAPSHOT_DIR --snapshot_sync_dir $SNAPSHOT_SYNC_DIR"
+    fi
+
+    export PYTORCH_CUDA_ALLOC_CONF=expandable_segments:True
+
+    # per-sequence messages are appended to the log by run_evo.py, the console gets rate-limited progress reports
+    SCRIPT_ARGS="$SCRIPT_ARGS --log_file $LOCAL_LOG --log_copy $OUTPUT_DIR/run_evo.log"
+    SCRIPT_ARGS="$SCRIPT_ARGS --progress_interval ${PROGRESS_INTERVAL:-30}"
+
+    # run in the background, so that terminate() can forward SIGTERM to it
+    python3 "$SCRIPTS_DIR/run_evo.py" $SCRIPT_ARGS &
+    echo $! > "$LOCAL_LOG_DIR/pid"
+    wait $!
+}
+
+copy_log() {
+    cp "$LOCAL_LOG" "$OUTPUT_DIR/run_evo.log" || true
+}
+
+terminate() {
+    # forward the signal to run_evo.py (which copies the log itself), then copy the complete log
+    if [ -f "$LOCAL_LOG_DIR/pid" ]; then
+        kill -TERM "$(cat "$LOCAL_LOG_DIR/pid")" 2>/dev/null || true
+    fi
+    wait
+    copy_log
+    exit 143
+}
+
+mkdir -p "$LOCAL_LOG_DIR" "$OUTPUT_DIR"
+: > "$LOCAL_LOG"
+rm -f "$LOCAL_LOG_DIR/exit_status" "$LOCAL_LOG_DIR/pid"
+
+# all output of the job (including output of CUDA libraries and crashes) goes to the console and the local log,
+# the pipeline runs in the background so that SIGTERM (preemption) is handled while it runs
+(
+    STATUS=0
+    run_job || STATUS=$?
+    echo $STATUS > "$LOCAL_LOG_DIR/exit_status"
+) 2>&1 | tee -a "$LOCAL_LOG" &
+trap terminate TERM
+wait $!
+
+copy_log
+exit "$(cat "$LOCAL_LOG_DIR/exit_status" 2>/dev/null || echo 1)"
@@ -0,0 +1,123 @@
+import atexit
+import os
+import shutil
+import signal
+import sys
+import time
+
+# the installed run log, see setup_run_log
+_run_log = None
+
+class RunLog:
+    """
+    Log of a run on local disk. The process output (stdout and stderr, including output of CUDA and other
+    libraries written directly to the file descriptors) is appended to it by the caller, e.g. through
+    tee in run_evo.sh. Per-item detail messages are buffered and appended at most every flush_interval
+    seconds. The log is copied to copy_path (e.g. the job output directory on the bucket mount) only
+    at checkpoints, at exit and on SIGTERM, so that logging does not write through the mount.
+    """
+
+    def __init__(self, log_file, copy_path=None, flush_interval=10.0):
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        self.log_file = log_file
+        self.copy_path = copy_path
+        self.flush_interval = flush_interval
+        # appended with single writes of whole lines, so lines do not interleave with the tee'd output
+        self.fd = os.open(log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.details = []
+        self.last_flush = time.time()
+
+    def detail(self, message):
+        self.details.append(message + "\n")
+        now = time.time()
+        if now - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.details and self.fd is not None:
+            os.write(self.fd, ''.join(self.details).encode('utf-8'))
+            self.details = []
+        self.last_flush = time.time()
+
+    def checkpoint(self):
+        """Flushes the log and copies it to copy_path, replacing the previous copy."""
+        for stream in (sys.stdout, sys.stderr):
+            stream.flush()
+        self.flush()
+        if self.copy_path:
+            tmp_path = self.copy_path + '.tmp'
+            shutil.copyfile(self.log_file, tmp_path)
+            os.replace(tmp_path, self.copy_path)
+
+    def close(self):
+        if self.fd is not None:
+            self.checkpoint()
+            os.close(self.fd)
+            self.fd = None
+
+def _terminate(signum, frame):
+    # atexit does not run on signals, copy the log before exiting
+    if _run_log is not None:
+        _run_log.close()
+    sys.exit(128 + signum)
+
+def setup_run_log(log_file, copy_path=None, flush_interval=10.0):
+    """
+    Installs the run log: detail messages are appended to log_file, which is copied to copy_path
+    at checkpoints, at exit and on SIGTERM. stdout and stderr are line buffered, so that their lines
+    reach the log (through the caller's tee) in order with the detail messages.
+    """
+    global _run_log
+    _run_log = RunLog(log_file, copy_path, flush_interval)
+    for stream in (sys.stdout, sys.stderr):
+        stream.reconfigure(line_buffering=True)
+    atexit.register(_run_log.close)
+    signal.signal(signal.SIGTERM, _terminate)
+    return _run_log
+
+def checkpoint():
+    """Copies the run log to its checkpoint path, if a run log is installed."""
+    if _run_log is not None:
+        _run_log.checkpoint()
+
+def detail(message):
+    """Per-item messages (e.g. per sequence or saved file), written only to the run log if one is installed."""
+    if _run_log is not None:
+        _run_log.detail(message)
+    else:
+        print(message)
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+class Progress:
+    """Prints a progress line with tokens/sec and ETA at most every interval seconds, and at completion."""
+
+    def __init__(self, total_items, total_tokens, interval=30.0, label='sequences'):
+        self.total_items = total_items
+        self.total_tokens = total_tokens
+        self.interval = interval
+        self.label = label
+        self.items = 0
+        self.tokens = 0
+        self.start_time = time.time()
+        self.last_report = self.start_time
+
+    def update(self, items=1, tokens=0):
+        self.items += items
+        self.tokens += tokens
+        now = time.time()
+        if self.items >= self.total_items or now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now):
+        # detail messages of the reported items come before the progress line
+        if _run_log is not None:
+            _run_log.flush()
+        elapsed = max(now - self.start_time, 1e-9)
+        rate = self.tokens / elapsed
+        remaining = (self.total_tokens - self.tokens) / rate if rate > 0 else 0
+        print(f"  progress: {self.items}/{self.total_items} {self.label}, {self.tokens}/{self.total_tokens} tokens, "
+              f"{rate:.0f} tokens/sec, elapsed {format_duration(elapsed)}, ETA {format_duration(remaining)}")
@@ -0,0 +1,275 @@
+import gc
+import os
+
+# model name -> architecture config in configs/
+MODEL_CONFIGS = {
+    'evo2_1b_base': 'evo2-1b-8k.yml',
+    'evo2_7b_base': 'evo2-7b-8k.yml',
+    'evo2_7b': 'evo2-7b-1m.yml',
+    'evo2_40b_base': 'evo2-40b-8k.yml',
+    'evo2_40b': 'evo2-40b-1m.yml'
+}
+
+# default configs directory, next to the scripts directory (both locally and in the bucket)
+DEFAULT_CONFIGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configs')
+
+# headroom over the activation memory estimate
+SAFETY_FACTOR = 1.5
+
+# shortest window used when falling back to windowed processing
+MIN_WINDOW = 1024
+
+def read_model_config(model_name, configs_dir=DEFAULT_CONFIGS_DIR):
+    """
+    Reads the scalar 'key: value' entries of a model's architecture config.
+    A minimal parser, so that no yaml (or torch) import is needed. Returns None for unknown models.
+    """
+    if model_name not in MODEL_CONFIGS:
+        return None
+    path = os.path.join(configs_dir, MODEL_CONFIGS[model_name])
+    if not os.path.exists(path):
+        return None
+    config = {}
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if ':' not in line:
+                continue
+            key, value = [part.strip() for part in line.split(':', 1)]
+            try:
+                config[key] = int(value)
+            except ValueError:
+                config[key] = value
+    return config
+
+def estimate_activation_bytes(length, batch, model_config):
+    """
+    Rough peak activation memory of a forward pass over batch x length tokens.
+    Per token, the dominant terms are the input projections (3x hidden, bf16), the FFT convolution
+    buffers (complex64 over the 2x padded length), the MLP (2x inner, bf16), and the logits (bf16)
+    with the float32 copy and log-softmax of the summary.
+    """
+    hidden = model_config['hidden_size']
+    inner = model_config.get('inner_mlp_size', 4 * hidden)
+    vocab = model_config['vocab_size']
+    per_token = hidden * (3 * 2 + 2 * 8) + inner * 2 * 2 + vocab * (2 + 4 + 4)
+    return int(batch * length * per_token * SAFETY_FACTOR)
+
+def estimate_log_softmax_bytes(length, batch, model_config):
+    """Memory of the float32 copy of the logits and their log-softmax over batch x length positions."""
+    return int(batch * length * model_config['vocab_size'] * (4 + 4) * SAFETY_FACTOR)
+
+def device_memory_budget(fraction=0.9):
+    """
+    Returns the usable free memory in bytes, or None without CUDA.
+    The model blocks are spread over all visible devices, so their free memory is summed.
+    """
+    import torch
+    if not torch.cuda.is_available():
+        return None
+    free = sum(torch.cuda.mem_get_info(i)[0] for i in range(torch.cuda.device_count()))
+    return int(free * fraction)
+
+def schedule_order(lengths):
+    """
+    Returns the processing order of sequences: longest first, so that memory problems surface
+    at the start of the job and later, shorter sequences reuse the already reserved memory.
+    """
+    return sorted(range(len(lengths)), key=lambda i: -lengths[i])
+
+def free_memory():
+    import torch
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+def window_ranges(length, window, overlap):
+    """
+    Splits [0, length) into windows of at most window tokens, consecutive windows overlapping by overlap.
+    Returns (start, end, keep_from) tuples, where positions [start + keep_from, end) are kept.
+    """
+    ranges = []
+    start, kept_until = 0, 0
+    while kept_until < length:
+        end = min(start + window, length)
+        ranges.append((start, end, kept_until - start))
+        kept_until = end
+        start = end - overlap
+    return ranges
+
+class AdaptiveRunner:
+    """
+    Runs forward passes within a memory budget.
+    forward_fn(input_ids) returns (logits [S, L, V], embeddings {layer: [S, L, D]}).
+    The batch of S rows (e.g. the two strands) is split into single rows if the memory estimate
+    exceeds the budget or torch.cuda.OutOfMemoryError is raised. A single row that runs out of memory
+    is processed in overlapping windows, starting from the largest window within the budget.
+    """
+
+    def __init__(self, forward_fn, model_config=None, budget_bytes=None, log=print):
+        self.forward_fn = forward_fn
+        self.model_config = model_config
+        self.budget_bytes = budget_bytes
+        self.log = log
+
+    def fits(self, length, batch):
+        if self.model_config is None or self.budget_bytes is None:
+            return True
+        return estimate_activation_bytes(length, batch, self.model_config) <= self.budget_bytes
+
+    def max_window(self, length):
+        """Largest window (halving from the full length) that fits the budget for a single row."""
+        window = length
+        while window > MIN_WINDOW and not self.fits(window, 1):
+            window //= 2
+        return max(window, min(MIN_WINDOW, length))
+
+    def run(self, input_ids):
+        import torch
+        batch, length = input_ids.shape[0], input_ids.shape[1]
+
+        # a single row is always tried in full first, since windows limit the context
+        fits = self.fits(length, batch)
+        if fits or batch == 1:
+            if not fits:
+                self.log(f"      length {length} exceeds the estimated memory budget, trying the full sequence")
+            # memory is freed after leaving the except block, whose traceback still references the failed pass
+            out_of_memory = False
+            try:
+                return self.forward_fn(input_ids)
+            except torch.cuda.OutOfMemoryError:
+                out_of_memory = True
+            if out_of_memory:
+                free_memory()
+                self.log(f"      out of memory for batch {batch} x {length}, retrying with a smaller "
+                         f"{'window' if batch == 1 else 'batch'}")
+        else:
+            self.log(f"      batch {batch} x {length} exceeds the memory budget, splitting")
+
+        if batch == 1:
+            window = self.max_window(length)
+            if window >= length:
+                # the estimate fits but the device ran out of memory, start below the full length
+                window = length // 2
+            return self.run_windowed(input_ids, window)
+
+        # process rows one at a time
+        results = [self.run(input_ids[k:k + 1]) for k in range(batch)]
+        return concat_outputs(results, dim=0)
+
+    def run_windowed(self, input_ids, window):
+        import torch
+        length = input_ids.shape[1]
+        while True:
+            if window < MIN_WINDOW and window < length:
+                raise RuntimeError(f"sequence of length {length} does not fit in memory, even with windows of {MIN_WINDOW}")
+            overlap = window // 4
+            ranges = window_ranges(length, window, overlap)
+            self.log(f"      WARNING: processing length {length} in {len(ranges)} windows of {window} "
+                     f"(overlap {overlap}), context is limited to the window")
+            parts = []
+            out_of_memory = False
+            try:
+                for start, end, keep_from in ranges:
+                    logits, embeddings = self.forward_fn(input_ids[:, start:end])
+                    parts.append(slice_outputs((logits, embeddings), keep_from))
+                return concat_outputs(parts, dim=1)
+            except torch.cuda.OutOfMemoryError:
+                out_of_memory = True
+            if out_of_memory:
+                parts = logits = embeddings = None
+                free_memory()
+                window //= 2
+                self.log(f"      out of memory in windowed processing, reducing window to {window}")
+
+    def max_chunk(self, length, batch):
+        """Largest number of positions (halving from length) whose float32 log-softmax fits the budget."""
+        chunk = length
+        if self.model_config is None or self.budget_bytes is None:
+            return chunk
+        while chunk > 1 and estimate_log_softmax_bytes(chunk, batch, self.model_config) > self.budget_bytes:
+            chunk //= 2
+        return chunk
+
+    def log_likelihoods(self, logits, input_ids):
+        """
+        Returns the total next-token log-likelihood of each row, computed in float32.
+        The log-softmax runs over chunks of positions within the memory budget, and the chunk
+        is halved on torch.cuda.OutOfMemoryError, so long inputs do not need a float32 copy of all logits.
+        """
+        import torch
+        import torch.nn.functional as F
+        batch, length = logits.shape[0], logits.shape[1] - 1
+        chunk = self.max_chunk(length, batch)
+        while True:
+            if chunk < 1:
+                raise RuntimeError(f"log-likelihoods of length {length} do not fit in memory")
+            out_of_memory = False
+            try:
+                totals = torch.zeros(batch, dtype=torch.float64, device=logits.device)
+                for start in range(0, length, chunk):
+                    end = min(start + chunk, length)
+                    # logits at position i predict the token at position i + 1
+                    log_probs = F.log_softmax(logits[:, start:end, :].to(torch.float32), dim=-1)
+                    target_ids = input_ids[:, start + 1:end + 1].long().unsqueeze(-1)
+                    totals += log_probs.gather(dim=2, index=target_ids).squeeze(-1).sum(dim=1).double()
+                    del log_probs
+                return totals.tolist()
+            except torch.cuda.OutOfMemoryError:
+                out_of_memory = True
+            if out_of_memory:
+                log_probs = totals = None
+                free_memory()
+                chunk //= 2
+                self.log(f"      out of memory in the log-softmax, reducing chunk to {chunk} positions")
+
+def slice_outputs(outputs, keep_from):
+    logits, embeddings = outputs
+    logits = logits[:, keep_from:]
+    embeddings = {name: tensor[:, keep_from:] for name, tensor in (embeddings or {}).items()}
+    return logits, embeddings
+
+def concat_outputs(outputs, dim):
+    """Concatenates (logits, embeddings) outputs along the batch (0) or position (1) dimension."""
+    import torch
+    logits = torch.cat([output[0] for output in outputs], dim=dim)
+    embeddings = {}
+    for name in (outputs[0][1] or {}):
+        embeddings[name] = torch.cat([output[1][name] for output in outputs], dim=dim)
+    return logits, embeddings
+
+def parse_model_routes(routes_str):
+    """
+    Parses 'model:max_length,...,model' into [(model, max_length)]; the last model has no limit (None).
+    """
+    routes = []
+    for entry in routes_str.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if ':' in entry:
+            model_name, max_length = entry.split(':', 1)
+            routes.append((model_name.strip(), int(max_length)))
+        else:
+            routes.append((entry, None))
+    if not routes:
+        raise ValueError(f"no models in routes: {routes_str}")
+    for model_name, max_length in routes[:-1]:
+        if max_length is None:
+            raise ValueError(f"only the last model in routes may be without a maximal length: {routes_str}")
+    return routes
+
+def assign_routes(lengths, routes):
+    """
+    Assigns each sequence to the first model whose maximal length covers it.
+    Returns [(model, max_length, indices)] in route order. Sequences longer than all limits go to the last model.
+    """
+    phases = [(model_name, max_length, []) for model_name, max_length in routes]
+    for i, length in enumerate(lengths):
+        for model_name, max_length, indices in phases:
+            if max_length is None or length <= max_length:
+                indices.append(i)
+                break
+        else:
+            phases[-1][2].append(i)
+    return phases
@@ -4,7 +4,7 @@
 export POS=$1
 echo "generating codon variants at position $POS"
 
-# generate all codon variants at position 83
+# generate all codon variants at position 83 (plus strand only, the job adds the reverse complement)
 mkdir -p output
 python3 scripts/generate_codon_variants.py \
 	--fasta input/gene_variants.fasta \
@@ -12,11 +12,13 @@ python3 scripts/generate_codon_variants.py \
 	--aa-coord $POS \
 	--seq-id 83_S1 \
 	--output-fasta output/query_$POS.fasta \
-	--output-codon-table output/query_$POS.tab
+	--output-codon-table output/query_$POS.tab \
+	--plus-only
 
-# submit job
+# submit job, evaluating both strands of each variant
 evo_gcp submit --job rc-job \
-  --output_type logits \
+  --output_type summary_only \
+  --strand_mode both \
   --input_fasta `pwd`/output/query_$POS.fasta \
 	--job_version $POS \
   --wait
@@ -28,15 +30,9 @@ mkdir -p jobs/rc-job-$POS
 evo_gcp download --job rc-job --job_version $POS --jobs_dir `pwd`/jobs
 
 # crete strand comparison table
-Rscript -e "
-library(reticulate)
-use_python(Sys.which('python3'), required=TRUE)
-source('scripts/create_strand_table.r')
-create_strand_table(
-  ifn='output/query_$POS.fasta',
-  idir='jobs/rc-job-$POS/output',
-  ofn='output/compare_strands_$POS.tab')
-"
+python3 scripts/strand_analysis.py from-summary \
+	--input jobs/rc-job-$POS/output/input_strands_unsteered.txt \
+	--output output/compare_strands_$POS.tab
 
 # plot strand comparison
 Rscript -e "
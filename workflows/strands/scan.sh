@@ -0,0 +1,46 @@
+#!/bin/bash
+
+# scan a range of positions, running the model jobs concurrently
+FIRST_POS=$1
+LAST_POS=$2
+MAX_CONCURRENT=${3:-8}
+echo "scanning codon positions $FIRST_POS-$LAST_POS, up to $MAX_CONCURRENT jobs at a time"
+
+# generate codon variants for all positions and a jobs table
+mkdir -p output
+JOBS_TABLE=output/jobs_${FIRST_POS}_${LAST_POS}.tsv
+printf "job\tjob_version\tinput_fasta\n" > $JOBS_TABLE
+for POS in $(seq $FIRST_POS $LAST_POS); do
+	python3 scripts/generate_codon_variants.py \
+		--fasta input/gene_variants.fasta \
+		--codon-table input/codon_table \
+		--aa-coord $POS \
+		--seq-id 83_S1 \
+		--output-fasta output/query_$POS.fasta \
+		--output-codon-table output/query_$POS.tab \
+		--plus-only > /dev/null
+	printf "rc-job\t$POS\t`pwd`/output/query_$POS.fasta\n" >> $JOBS_TABLE
+done
+
+# submit all jobs, results are downloaded as jobs complete
+evo_gcp submit_many \
+	--jobs_table $JOBS_TABLE \
+	--max_concurrent $MAX_CONCURRENT \
+	--output_type summary_only \
+	--strand_mode both \
+	--jobs_dir `pwd`/jobs
+
+# create strand comparison tables and plots
+for POS in $(seq $FIRST_POS $LAST_POS); do
+	python3 scripts/strand_analysis.py from-summary \
+		--input jobs/rc-job-$POS/output/input_strands_unsteered.txt \
+		--output output/compare_strands_$POS.tab
+	Rscript -e "
+source('scripts/plot_strand_scatter.r')
+plot_strand_scatter(
+  ifn_tab='output/compare_strands_$POS.tab',
+  ifn_codon='output/query_$POS.tab',
+  title=$POS,
+  fdir='figures')
+"
+done
@@ -49,3 +49,23 @@ create_strand_table <- function(ifn, idir, ofn) {
   cat(sprintf("saving to %s\n", ofn))
   write.table(rr, ofn, sep = "\t", row.names = FALSE, quote = FALSE)
 }
+
+# same table from the paired strand table of a job run with STRAND_MODE=both,
+# no logit files are needed
+create_strand_table_from_summary <- function(ifn, ofn) {
+  cat(sprintf("reading strand table %s\n", ifn))
+  tt <- read.delim(ifn)
+
+  # convert natural log to log2 and add the uniform prior of the first
+  # nucleotide, to match get_total_ll()
+  to_log2 <- function(x) log2(0.25) + x / log(2)
+
+  rr <- data.frame(
+    id = gsub("_P$", "", tt$seq_id),
+    plus = to_log2(tt$plus_log_likelihood),
+    minus = to_log2(tt$minus_log_likelihood)
+  )
+
+  cat(sprintf("saving to %s\n", ofn))
+  write.table(rr, ofn, sep = "\t", row.names = FALSE, quote = FALSE)
+}
@@ -42,6 +42,8 @@ def main():
     parser.add_argument('--seq-id', '-s', required=True, help='Sequence identifier')
     parser.add_argument('--output-fasta', '-o', required=True, help='Output FASTA file')
     parser.add_argument('--output-codon-table', '-v', required=True, help='Output codon file (original codon)')
+    parser.add_argument('--plus-only', action='store_true',
+                        help='Write only forward (P) variants, for jobs that evaluate both strands (STRAND_MODE=both)')
     
     args = parser.parse_args()
     
@@ -92,6 +94,10 @@ def main():
             out.write(f">{args.aa_coord}_{aa}_{codon}_P\n")
             out.write(f"{variant_seq}\n")
             
+            # reverse complement is generated by the model job in both-strands mode
+            if args.plus_only:
+                continue
+
             # create reverse complement variant
             rc_seq = str(Seq(variant_seq).reverse_complement())
             out.write(f">{args.aa_coord}_{aa}_{codon}_M\n")
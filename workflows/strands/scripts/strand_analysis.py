@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import math
+import os
+import sys
+
+import numpy as np
+
+# load_array decodes all output precisions and compressions of run_evo.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'scripts'))
+from output_codec import load_array
+
+COMPLEMENT_TABLE = str.maketrans("ACGT", "TGCA")
+
+# log2 of the uniform prior of the first nucleotide, which has no prediction
+FIRST_BASE_LOG2 = math.log2(0.25)
+
+# positions per float32 log-softmax chunk
+POSITION_CHUNK = 65536
+
+def reverse_complement(sequence):
+    return sequence.translate(COMPLEMENT_TABLE)[::-1]
+
+def read_fasta(fasta_file):
+    """read fasta file into an ordered dict of id -> uppercase sequence"""
+    sequences = {}
+    seq_id = None
+    with open(fasta_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('>'):
+                seq_id = line[1:].split()[0]
+                sequences[seq_id] = []
+            elif seq_id is not None:
+                sequences[seq_id].append(line)
+    return {seq_id: ''.join(parts).upper() for seq_id, parts in sequences.items()}
+
+def safe_filename(seq_id):
+    """same file name encoding of sequence ids as run_evo.py"""
+    return "".join(c if c.isalnum() else "_" for c in seq_id)
+
+def find_logits_file(logits_dir, seq_id, scale):
+    matches = glob.glob(os.path.join(logits_dir, f"*_{glob.escape(safe_filename(seq_id))}_logits_{scale}.np*"))
+    if not matches:
+        raise FileNotFoundError(f"no logits file for {seq_id} ({scale}) in {logits_dir}")
+    return matches[0]
+
+def load_logits(path):
+    """returns logits as a [S, L, V] array, memory mapped for plain .npy files"""
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    return load_array(path)
+
+def log2_likelihoods(logits, sequence, chunk=POSITION_CHUNK):
+    """
+    per-position log2 probabilities of the bases of one sequence
+    logits: [L, V] (e.g. a memory map), position i-1 predicts base i; the first base gets the uniform prior
+    positions are converted to float32 in chunks, so that only one chunk of the logits is in memory
+    returns [L]
+    """
+    tokens = np.frombuffer(sequence.encode('ascii'), dtype=np.uint8).astype(np.int64)
+    log2_probs = np.empty(len(sequence), dtype=np.float64)
+    log2_probs[0] = FIRST_BASE_LOG2
+    for start in range(0, len(sequence) - 1, chunk):
+        end = min(start + chunk, len(sequence) - 1)
+        # log-softmax over the vocabulary of the predicting positions
+        pred = np.asarray(logits[start:end], dtype=np.float32)
+        pred_max = pred.max(axis=1)
+        log_norm = np.log(np.exp(pred - pred_max[:, np.newaxis]).sum(axis=1)) + pred_max
+        log_probs = pred[np.arange(end - start), tokens[start + 1:end + 1]] - log_norm
+        log2_probs[start + 1:end + 1] = log_probs / math.log(2)
+    return log2_probs
+
+def check_length(logits, sequence, seq_id):
+    """logits must cover the whole sequence, which is not the case for jobs run with a query table"""
+    if logits.shape[-2] != len(sequence):
+        raise ValueError(f"logits of {seq_id} cover {logits.shape[-2]} positions, but the sequence has {len(sequence)} bases; "
+                         f"logits of jobs with a query table cover only the query range, use from-summary "
+                         f"or logits of a job without a query table")
+
+def strand_log2_likelihoods(fasta, logits_dir, scale, codons=False):
+    """
+    log2 likelihoods of the plus and minus strand of each variant (ids ending with _P)
+    logits are read from both-strands files ([2, L, V] for <id>_P) or from separate <id>_P and <id>_M files,
+    one variant at a time
+    returns ids (without _P), plus and minus totals, and with codons the plus and minus log2 likelihoods
+    of the three bases of the variant codon (None otherwise)
+    """
+    plus_ids = [seq_id for seq_id in fasta if seq_id.endswith('_P')]
+    ids = [seq_id[:-2] for seq_id in plus_ids]
+    plus_totals, minus_totals = np.zeros(len(ids)), np.zeros(len(ids))
+    codon_plus, codon_minus = (np.zeros(len(ids)), np.zeros(len(ids))) if codons else (None, None)
+    for k, plus_id in enumerate(plus_ids):
+        plus_seq = fasta[plus_id]
+        minus_seq = fasta.get(plus_id[:-2] + '_M', reverse_complement(plus_seq))
+        logits = load_logits(find_logits_file(logits_dir, plus_id, scale))
+        check_length(logits, plus_seq, plus_id)
+        plus = log2_likelihoods(logits[0], plus_seq)
+        if logits.shape[0] == 2:
+            minus = log2_likelihoods(logits[1], minus_seq)
+        else:
+            minus_logits = load_logits(find_logits_file(logits_dir, plus_id[:-2] + '_M', scale))
+            check_length(minus_logits, minus_seq, plus_id[:-2] + '_M')
+            minus = log2_likelihoods(minus_logits[0], minus_seq)
+
+        plus_totals[k], minus_totals[k] = plus.sum(), minus.sum()
+        if codons:
+            codon_plus[k], codon_minus[k] = codon_log2_likelihoods(ids[k], plus, minus)
+    return ids, plus_totals, minus_totals, codon_plus, codon_minus
+
+def codon_log2_likelihoods(variant_id, plus, minus):
+    """
+    log2 likelihoods of the three bases of the variant codon on each strand
+    the codon coordinate is the first field of the id (<coord>_<aa>_<codon>)
+    """
+    coord = int(variant_id.split('_')[0])
+    offsets = (coord - 1) * 3 + np.arange(3)
+    # the same bases on the minus strand are at reverse complement coordinates
+    return plus[offsets].sum(), minus[len(minus) - 1 - offsets].sum()
+
+def write_table(ofn, ids, plus, minus):
+    """write an id/plus/minus table, in the format of create_strand_table() in R"""
+    print(f"saving to {ofn}")
+    with open(ofn, 'w') as f:
+        f.write("id\tplus\tminus\n")
+        for variant_id, plus_value, minus_value in zip(ids, plus, minus):
+            f.write(f"{variant_id}\t{plus_value:.15g}\t{minus_value:.15g}\n")
+
+def table_from_summary(ifn, ofn):
+    """strand table from the paired strand table of a STRAND_MODE=both job, as create_strand_table_from_summary() in R"""
+    print(f"reading strand table {ifn}")
+    ids, plus, minus = [], [], []
+    with open(ifn, 'r') as f:
+        header = f.readline().rstrip('\n').split('\t')
+        for line in f:
+            row = dict(zip(header, line.rstrip('\n').split('\t')))
+            ids.append(row['seq_id'][:-2] if row['seq_id'].endswith('_P') else row['seq_id'])
+            plus.append(float(row['plus_log_likelihood']))
+            minus.append(float(row['minus_log_likelihood']))
+
+    # convert natural log to log2 and add the uniform prior of the first nucleotide
+    plus = FIRST_BASE_LOG2 + np.array(plus) / math.log(2)
+    minus = FIRST_BASE_LOG2 + np.array(minus) / math.log(2)
+    write_table(ofn, ids, plus, minus)
+
+def main():
+    parser = argparse.ArgumentParser(description='Strand comparison tables of codon variants, from job outputs')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    summary_parser = subparsers.add_parser('from-summary', help='strand table from the paired strand table of a both-strands job')
+    summary_parser.add_argument('--input', '-i', required=True, help='Paired strand table (<basename>_strands_<scale>.txt)')
+    summary_parser.add_argument('--output', '-o', required=True, help='Output strand comparison table')
+
+    logits_parser = subparsers.add_parser('from-logits', help='strand and codon tables from logit files')
+    logits_parser.add_argument('--fasta', '-f', required=True, help='Variants FASTA file (ids ending with _P, and _M if present)')
+    logits_parser.add_argument('--logits-dir', '-d', required=True, help='Job output directory with the logit files')
+    logits_parser.add_argument('--scale', default='unsteered', help='Scale name of the logit files (default: unsteered)')
+    logits_parser.add_argument('--output', '-o', required=True, help='Output strand comparison table')
+    logits_parser.add_argument('--codon-output', '-c', default=None, help='Output table of codon-level log2 likelihoods')
+
+    args = parser.parse_args()
+
+    if args.command == 'from-summary':
+        table_from_summary(args.input, args.output)
+        return
+
+    fasta = read_fasta(args.fasta)
+    print(f"reading logit files of {len(fasta)} sequences from {args.logits_dir}")
+    ids, plus, minus, codon_plus, codon_minus = strand_log2_likelihoods(
+        fasta, args.logits_dir, args.scale, codons=bool(args.codon_output))
+    write_table(args.output, ids, plus, minus)
+    if args.codon_output:
+        write_table(args.codon_output, ids, codon_plus, codon_minus)
+
+if __name__ == "__main__":
+    main()